@@ -0,0 +1,56 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def escritura_atomica(ruta):
+    """Da una ruta temporal única junto a `ruta` y la sustituye de golpe al salir sin error.
+
+    Todas las sesiones de Streamlit comparten proceso, así que el temporal no
+    puede depender del pid: cada escritura crea el suyo con `mkstemp` en el
+    mismo directorio (para que `os.replace` sea atómico). Acaba en ".tmp"
+    para que las limpiezas de las cachés lo ignoren.
+    """
+    directorio = os.path.dirname(ruta) or "."
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=f"{os.path.basename(ruta)}.", suffix=".tmp")
+    os.close(descriptor)
+    try:
+        yield temporal
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def entradas_por_uso(directorio, sufijo=""):
+    """(mtime, tamaño, nombre) de los archivos del directorio con ese sufijo, sin los ".tmp"."""
+    entradas = []
+    for nombre in os.listdir(directorio):
+        if not nombre.endswith(sufijo) or nombre.endswith(".tmp"):
+            continue
+        try:
+            st_ = os.stat(os.path.join(directorio, nombre))
+        except FileNotFoundError:
+            continue
+        entradas.append((st_.st_mtime, st_.st_size, nombre))
+    return entradas
+
+
+def expulsar_lru(directorio, max_bytes, sufijo="", conservar_ultimo=False):
+    """Borra los archivos usados hace más tiempo mientras el directorio supere `max_bytes`.
+
+    El uso es la fecha de modificación, que las cachés renuevan en cada
+    acierto. Con `conservar_ultimo` el más reciente (el que se acaba de
+    escribir) nunca se borra.
+    """
+    entradas = sorted(entradas_por_uso(directorio, sufijo))
+    total = sum(tamano for _, tamano, _ in entradas)
+    for _, tamano, nombre in entradas[:-1] if conservar_ultimo else entradas:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(directorio, nombre))
+        except FileNotFoundError:
+            pass
+        total -= tamano
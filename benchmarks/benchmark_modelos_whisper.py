@@ -0,0 +1,194 @@
+"""Compara tamaños de modelo Whisper, precisión, hilos y beam sobre audios de referencia.
+
+Cada audio del directorio de fixtures debe tener al lado su transcripción de
+referencia con el mismo nombre y extensión .txt (p. ej. `entrevista.mp3` y
+`entrevista.txt`). Cada configuración se ejecuta en un proceso nuevo, así que
+la memoria pico medida es la de ese modelo y no la de los anteriores.
+
+Uso:
+    python benchmarks/benchmark_modelos_whisper.py [benchmarks/fixtures] \
+        [--modelos tiny base small medium] [--precisiones fp32 int8] \
+        [--hilos 1 4] [--beams 1 5] [--idioma es] [--salida resultados.jsonl]
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metricas  # noqa: E402
+from preprocesado import SAMPLE_RATE, cargar_audio  # noqa: E402
+
+EXTENSIONES_AUDIO = (".mp3", ".wav", ".mp4", ".m4a", ".ogg", ".flac")
+
+
+def buscar_fixtures(directorio):
+    """Devuelve pares (audio, texto_referencia) de los audios con su .txt al lado."""
+    fixtures = []
+    for nombre in sorted(os.listdir(directorio)):
+        base, extension = os.path.splitext(nombre)
+        referencia = os.path.join(directorio, base + ".txt")
+        if extension.lower() in EXTENSIONES_AUDIO and os.path.exists(referencia):
+            with open(referencia, "r", encoding="utf-8") as f:
+                fixtures.append((os.path.join(directorio, nombre), f.read()))
+    return fixtures
+
+
+def normalizar_palabras(texto):
+    """Minúsculas y sin puntuación, para que el WER no penalice el formato."""
+    return re.findall(r"\w+", texto.lower())
+
+
+def tasa_error_palabras(referencia, hipotesis):
+    """WER: sustituciones, borrados e inserciones sobre el número de palabras de referencia."""
+    ref = normalizar_palabras(referencia)
+    hip = normalizar_palabras(hipotesis)
+    if not ref:
+        return float(bool(hip))
+    # Distancia de edición por palabras con una sola fila de la tabla
+    fila = list(range(len(hip) + 1))
+    for i, palabra_ref in enumerate(ref, 1):
+        diagonal, fila[0] = fila[0], i
+        for j, palabra_hip in enumerate(hip, 1):
+            diagonal, fila[j] = fila[j], min(
+                fila[j] + 1,
+                fila[j - 1] + 1,
+                diagonal + (palabra_ref != palabra_hip),
+            )
+    return fila[-1] / len(ref)
+
+
+def cuantizar_int8(model):
+    """Cuantización dinámica a int8 de todas las capas lineales; solo aplica en CPU.
+
+    `quantize_dynamic` compara el tipo exacto de cada módulo y Whisper define
+    sus proyecciones con su propia subclase `whisper.model.Linear`, que además
+    `nnqd.Linear.from_float` no acepta. Por eso primero se sustituyen por
+    `nn.Linear` con los mismos pesos y después se cuantizan; si ninguna capa
+    acaba cuantizada, la configuración falla en vez de medir fp32 como int8.
+    """
+    import torch
+    import torch.ao.nn.quantized.dynamic as nnqd
+    from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic
+    from whisper.model import Linear
+
+    for padre in list(model.modules()):
+        for nombre, hijo in list(padre.named_children()):
+            if isinstance(hijo, Linear):
+                lineal = torch.nn.Linear(hijo.in_features, hijo.out_features, bias=hijo.bias is not None)
+                lineal.weight = hijo.weight
+                lineal.bias = hijo.bias
+                setattr(padre, nombre, lineal)
+    model = quantize_dynamic(
+        model,
+        qconfig_spec={torch.nn.Linear: default_dynamic_qconfig},
+        dtype=torch.qint8,
+        mapping={torch.nn.Linear: nnqd.Linear},
+    )
+    cuantizadas = sum(1 for modulo in model.modules() if isinstance(modulo, nnqd.Linear))
+    if not cuantizadas:
+        raise RuntimeError("La cuantización int8 no convirtió ninguna capa lineal del modelo")
+    return model
+
+
+def ejecutar_configuracion(modelo, precision, hilos, beam, idioma, fixtures):
+    """Carga un modelo con la configuración dada y transcribe todos los fixtures.
+
+    Se ejecuta dentro de un proceso propio; devuelve las filas por audio y la
+    memoria pico del proceso.
+    """
+    import torch
+    import whisper
+
+    torch.set_num_threads(hilos)
+    inicio = time.time()
+    model = whisper.load_model(modelo, device="cpu")
+    if precision == "int8":
+        model = cuantizar_int8(model)
+    tiempo_carga = time.time() - inicio
+
+    opciones = {"language": idioma, "fp16": False}
+    if beam > 1:
+        opciones.update(beam_size=beam, best_of=beam)
+    filas = []
+    for ruta, referencia in fixtures:
+        inicio = time.time()
+        audio = cargar_audio(ruta)
+        tiempo_decodificacion = time.time() - inicio
+        inicio = time.time()
+        result = model.transcribe(audio, **opciones)
+        tiempo_inferencia = time.time() - inicio
+        duracion = len(audio) / SAMPLE_RATE
+        filas.append({
+            "archivo": os.path.basename(ruta),
+            "duracion_audio": duracion,
+            "tiempo_decodificacion_audio": tiempo_decodificacion,
+            "tiempo_inferencia": tiempo_inferencia,
+            "factor_tiempo_real": duracion / tiempo_inferencia if tiempo_inferencia else None,
+            "segmentos": len(result.get("segments", [])),
+            "wer": tasa_error_palabras(referencia, result["text"]),
+        })
+    return tiempo_carga, metricas.memoria_pico(), filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "fixtures", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+    )
+    parser.add_argument("--modelos", nargs="+", default=["tiny", "base", "small", "medium"])
+    parser.add_argument("--precisiones", nargs="+", choices=["fp32", "int8"], default=["fp32", "int8"])
+    parser.add_argument("--hilos", nargs="+", type=int, default=[os.cpu_count() or 1])
+    parser.add_argument("--beams", nargs="+", type=int, default=[1, 5])
+    parser.add_argument("--idioma", default="es")
+    parser.add_argument("--salida", help="archivo JSONL donde añadir una línea por configuración y audio")
+    args = parser.parse_args()
+
+    fixtures = buscar_fixtures(args.fixtures) if os.path.isdir(args.fixtures) else []
+    if not fixtures:
+        parser.error(f"no hay audios con su transcripción .txt en {args.fixtures}")
+    print(f"{len(fixtures)} audios, {sum(len(normalizar_palabras(r)) for _, r in fixtures)} palabras de referencia")
+
+    print(
+        f"{'modelo':8} {'prec.':5} {'hilos':>5} {'beam':>4} {'carga (s)':>9} "
+        f"{'t. real':>8} {'WER':>7} {'memoria (MB)':>12}"
+    )
+    contexto = multiprocessing.get_context("spawn")
+    for modelo, precision, hilos, beam in itertools.product(args.modelos, args.precisiones, args.hilos, args.beams):
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+            try:
+                tiempo_carga, memoria, filas = pool.submit(
+                    ejecutar_configuracion, modelo, precision, hilos, beam, args.idioma, fixtures
+                ).result()
+            except RuntimeError as e:
+                print(f"{modelo:8} {precision:5} {hilos:5d} {beam:4d} falló: {e}")
+                continue
+
+        # Agregados ponderados por duración y por palabras, no media de medias
+        audio_total = sum(f["duracion_audio"] for f in filas)
+        inferencia_total = sum(f["tiempo_inferencia"] for f in filas)
+        palabras = [len(normalizar_palabras(r)) for _, r in fixtures]
+        wer = sum(f["wer"] * n for f, n in zip(filas, palabras)) / (sum(palabras) or 1)
+        print(
+            f"{modelo:8} {precision:5} {hilos:5d} {beam:4d} {tiempo_carga:9.1f} "
+            f"{audio_total / inferencia_total:7.2f}x {wer:7.2%} {(memoria or 0) / 1024 / 1024:12.0f}"
+        )
+
+        if args.salida:
+            configuracion = {
+                "modelo": modelo, "precision": precision, "hilos": hilos, "beam": beam,
+                "idioma": args.idioma, "tiempo_carga_modelo": tiempo_carga, "memoria_pico": memoria,
+            }
+            with open(args.salida, "a", encoding="utf-8") as f:
+                for fila in filas:
+                    f.write(json.dumps({"timestamp": time.time(), **configuracion, **fila}, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compara los motores de transcripción (openai-whisper fp32 y faster-whisper int8).
+
+Cada motor se ejecuta en un proceso nuevo para medir su memoria pico por
+separado. Para cada audio se muestra el tiempo de inferencia de cada motor,
+la aceleración y la diferencia entre ambas transcripciones (WER tomando la de
+openai-whisper como referencia).
+
+Uso:
+    python benchmarks/benchmark_motores.py audio1.mp3 [audio2.wav ...] \
+        [--modelo base] [--hilos 4] [--idioma es]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metricas  # noqa: E402
+from benchmark_modelos_whisper import tasa_error_palabras  # noqa: E402
+from motores_transcripcion import MOTORES, obtener_motor  # noqa: E402
+from preprocesado import SAMPLE_RATE, cargar_audio  # noqa: E402
+
+
+def ejecutar_motor(motor, modelo, hilos, idioma, audios):
+    """Carga el modelo con el motor dado y transcribe los audios en este proceso."""
+    inicio = time.time()
+    model = obtener_motor(motor).cargar(modelo, "cpu", hilos)
+    tiempo_carga = time.time() - inicio
+    resultados = []
+    for ruta in audios:
+        audio = cargar_audio(ruta)
+        inicio = time.time()
+        result = model.transcribe(audio, language=idioma, fp16=False)
+        resultados.append({
+            "duracion": len(audio) / SAMPLE_RATE,
+            "tiempo_inferencia": time.time() - inicio,
+            "text": result["text"],
+            "segments": result["segments"],
+        })
+    return tiempo_carga, metricas.memoria_pico(), resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audios", nargs="+")
+    parser.add_argument("--modelo", default="base")
+    parser.add_argument("--hilos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--idioma", default="es")
+    args = parser.parse_args()
+
+    contexto = multiprocessing.get_context("spawn")
+    medidas = {}
+    for motor in MOTORES:
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+            medidas[motor] = pool.submit(
+                ejecutar_motor, motor, args.modelo, args.hilos, args.idioma, args.audios
+            ).result()
+
+    (base, (carga_a, memoria_a, res_a)), (rapido, (carga_b, memoria_b, res_b)) = medidas.items()
+    print(f"{'archivo':30} {'duración':>9} {base:>15} {rapido:>15} {'aceleración':>11} {'difer. WER':>10} {'Δ fin (s)':>9}")
+    for ruta, a, b in zip(args.audios, res_a, res_b):
+        # Los segmentos de ambos motores deben acabar en el mismo punto del audio
+        fin_a = a["segments"][-1]["end"] if a["segments"] else 0.0
+        fin_b = b["segments"][-1]["end"] if b["segments"] else 0.0
+        print(
+            f"{os.path.basename(ruta)[:30]:30} {a['duracion']:9.1f} {a['tiempo_inferencia']:15.1f} "
+            f"{b['tiempo_inferencia']:15.1f} {a['tiempo_inferencia'] / b['tiempo_inferencia']:10.2f}x "
+            f"{tasa_error_palabras(a['text'], b['text']):10.2%} {fin_b - fin_a:9.2f}"
+        )
+
+    total_a = sum(r["tiempo_inferencia"] for r in res_a)
+    total_b = sum(r["tiempo_inferencia"] for r in res_b)
+    print(f"\nCarga del modelo: {base} {carga_a:.1f} s · {rapido} {carga_b:.1f} s")
+    print(f"Inferencia total: {base} {total_a:.1f} s · {rapido} {total_b:.1f} s ({total_a / total_b:.2f}x)")
+    print(
+        f"Memoria pico: {base} {(memoria_a or 0) / 1024 / 1024:.0f} MB · "
+        f"{rapido} {(memoria_b or 0) / 1024 / 1024:.0f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Mide la exportación de subtítulos sobre una transcripción sintética muy larga.
+
+Compara la concatenación con `+=` que usaba `generar_srt` con el buffer lineal
+y con la escritura incremental a disco desde un generador, que es la que
+mantiene la memoria plana.
+
+Uso:
+    python benchmarks/benchmark_subtitulos.py [--segmentos 50000] [--formato srt]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subtitulos import a_texto, exportar_a_archivo, formato_tiempo  # noqa: E402
+
+
+def segmentos_sinteticos(n):
+    """Genera n segmentos de ~3 s con texto de longitud variable, sin guardarlos en una lista."""
+    for i in range(n):
+        yield {"start": i * 3.0, "end": i * 3.0 + 2.75, "text": f" Segmento número {i} " + "palabra " * (i % 12)}
+
+
+def concatenar_srt(segmentos):
+    """La implementación anterior: una cadena que crece con `+=` segmento a segmento."""
+    srt_content = ""
+    for i, segment in enumerate(segmentos, 1):
+        start = formato_tiempo(segment["start"])
+        end = formato_tiempo(segment["end"])
+        srt_content += f"{i}\n{start} --> {end}\n{segment['text'].strip()}\n\n"
+    return srt_content
+
+
+def medir(nombre, funcion):
+    # Tiempo y memoria en pasadas separadas: tracemalloc ralentiza cada asignación
+    inicio = time.perf_counter()
+    funcion()
+    duracion = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nombre:40} {duracion:9.3f} s {pico / 1024 / 1024:10.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segmentos", type=int, default=50000)
+    parser.add_argument("--formato", choices=["srt", "vtt", "txt"], default="srt")
+    args = parser.parse_args()
+
+    n = args.segmentos
+    lista = list(segmentos_sinteticos(n))
+    print(f"{n} segmentos ({n * 3 / 3600:.1f} h de audio simulado)")
+    print(f"{'método':40} {'tiempo':>11} {'memoria pico':>13}")
+    if args.formato == "srt":
+        medir("concatenación con += (anterior)", lambda: concatenar_srt(lista))
+    medir("buffer en memoria (a_texto)", lambda: a_texto(lista, args.formato))
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, f"salida.{args.formato}")
+        medir("a disco desde lista", lambda: exportar_a_archivo(lista, args.formato, ruta))
+        # Sin lista previa: así se comporta la exportación de medios muy largos
+        medir("a disco desde generador", lambda: exportar_a_archivo(segmentos_sinteticos(n), args.formato, ruta))
+        print(f"\nTamaño del archivo: {os.path.getsize(ruta) / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
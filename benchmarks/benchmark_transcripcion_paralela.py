@@ -0,0 +1,54 @@
+"""Compara la transcripción en una sola llamada con la paralela por silencios.
+
+Uso:
+    python benchmarks/benchmark_transcripcion_paralela.py audio1.mp3 [audio2.wav ...] \
+        [--modelo base] [--procesos 4] [--segundos-trozo 60]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcripcion import TranscriptorParalelo, transcribir  # noqa: E402
+from whisper_modelos import RegistroModelos  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audios", nargs="+")
+    parser.add_argument("--modelo", default="base")
+    parser.add_argument("--idioma", default="es")
+    parser.add_argument("--procesos", type=int, default=max(2, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--segundos-trozo", type=float, default=60)
+    args = parser.parse_args()
+
+    registro = RegistroModelos()
+    registro.obtener(args.modelo, "cpu")  # la carga no cuenta en la comparación
+    paralelo = TranscriptorParalelo(args.modelo, args.procesos)
+    # Calentar el pool para que cada proceso tenga ya su modelo cargado
+    list(paralelo._pool.map(abs, range(args.procesos)))
+
+    print(f"{'archivo':30} {'duración':>9} {'1 llamada':>10} {'paralelo':>10} {'aceleración':>11} {'Δ fin (s)':>9}")
+    for ruta in args.audios:
+        inicio = time.time()
+        secuencial = transcribir(ruta, registro, args.modelo, args.idioma)
+        t_secuencial = time.time() - inicio
+
+        inicio = time.time()
+        resultado = paralelo.transcribir(ruta, args.idioma, args.segundos_trozo)
+        t_paralelo = time.time() - inicio
+
+        # Las marcas de tiempo deben seguir alineadas con el audio original
+        fin_secuencial = secuencial["segments"][-1]["end"] if secuencial["segments"] else 0.0
+        fin_paralelo = resultado["segments"][-1]["end"] if resultado["segments"] else 0.0
+        print(
+            f"{os.path.basename(ruta)[:30]:30} {resultado['duration']:9.1f} {t_secuencial:10.1f} "
+            f"{t_paralelo:10.1f} {t_secuencial / t_paralelo:10.2f}x {fin_paralelo - fin_secuencial:9.2f}"
+        )
+    paralelo.cerrar()
+
+
+if __name__ == "__main__":
+    main()
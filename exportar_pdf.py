@@ -0,0 +1,39 @@
+from fpdf import FPDF
+
+
+class PDF(FPDF):
+    def header(self):
+        self.set_font("Arial", "B", 12)
+        self.cell(0, 10, "Generado por Fabric AI", 0, 1, "C")
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font("Arial", "I", 8)
+        self.cell(0, 10, f"Página {self.page_no()}", 0, 0, "C")
+
+
+def markdown_to_pdf(markdown_file, pdf_file):
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    with open(markdown_file, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    lines = content.split("\n")
+    for line in lines:
+        if line.startswith("# "):
+            pdf.set_font("Arial", "B", 16)
+            pdf.cell(
+                0, 10, line[2:].encode("latin-1", "replace").decode("latin-1"), ln=True
+            )
+        elif line.startswith("## "):
+            pdf.set_font("Arial", "B", 14)
+            pdf.cell(
+                0, 10, line[3:].encode("latin-1", "replace").decode("latin-1"), ln=True
+            )
+        else:
+            pdf.set_font("Arial", size=12)
+            pdf.multi_cell(0, 5, line.encode("latin-1", "replace").decode("latin-1"))
+
+    pdf.output(pdf_file)
@@ -0,0 +1,641 @@
+import asyncio
+import codecs
+import hashlib
+import json
+import os
+import queue
+import re
+import shlex
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+import metricas
+from archivos import escritura_atomica
+
+
+# Directorio, caducidad y número máximo de entradas de la caché de respuestas
+CACHE_DIR_DEFECTO = os.environ.get("FABRIC_CACHE_DIR", os.path.join("cache", "fabric"))
+CACHE_TTL_DEFECTO = int(os.environ.get("FABRIC_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRADAS_DEFECTO = int(os.environ.get("FABRIC_CACHE_MAX_ENTRADAS", "500"))
+
+# Segundos de pared que puede durar una ejecución de fabric (0 = sin límite) y
+# espera entre SIGTERM y SIGKILL al detenerla
+FABRIC_TIMEOUT_DEFECTO = float(os.environ.get("FABRIC_TIMEOUT", "600"))
+SEGUNDOS_GRACIA = 5
+
+_bucle = None
+_bucle_lock = threading.Lock()
+
+
+def _bucle_subprocesos():
+    """Bucle de asyncio en un hilo propio, compartido por todas las ejecuciones."""
+    global _bucle
+    with _bucle_lock:
+        if _bucle is None:
+            _bucle = asyncio.new_event_loop()
+            threading.Thread(target=_bucle.run_forever, daemon=True).start()
+    return _bucle
+
+
+def construir_comando(input_type, prompt, fabric_command, model_name, stream=False):
+    """Construye la línea de bash que invoca a fabric según el tipo de entrada.
+
+    Con `prompt=None` el texto no va en la línea de comandos: se escribe por
+    stdin desde `EjecucionFabric(comando, entrada=...)`.
+    """
+    opciones = f"--pattern {fabric_command} --model {model_name} --language=es"
+    if stream:
+        opciones += " --stream"
+    if prompt is None:
+        return f"fabric {opciones}"
+    elif input_type == "Texto":
+        # Aseguramos el prompt para manejar caracteres especiales
+        return f"echo {shlex.quote(prompt)} | fabric {opciones}"
+    elif input_type == "YouTube":
+        return f"fabric -y {shlex.quote(prompt)} {opciones}"
+    else:  # URL
+        return f"fabric -u {shlex.quote(prompt)} {opciones}"
+
+
+def describir_comando(comando, entrada=None):
+    """Patrón, modelo, tipo y tamaño de la entrada de una línea de `construir_comando`.
+
+    Es lo que se registra en las métricas: nunca el texto ni la URL en sí.
+    """
+    partes = shlex.split(comando)
+    fabric = partes[partes.index("fabric"):] if "fabric" in partes else partes
+    opciones = dict(zip(fabric, fabric[1:]))
+    if "-y" in opciones:
+        tipo, contenido = "YouTube", opciones["-y"]
+    elif "-u" in opciones:
+        tipo, contenido = "URL", opciones["-u"]
+    elif entrada is not None:
+        tipo, contenido = "Texto", entrada
+    else:
+        tipo, contenido = "Texto", partes[1] if partes[0] == "echo" else ""
+    return {
+        "patron": opciones.get("--pattern"),
+        "modelo": opciones.get("--model"),
+        "tipo_entrada": tipo,
+        "caracteres_entrada": len(contenido),
+    }
+
+
+def normalizar_entrada(input_type, prompt):
+    """Normaliza el texto o la URL para que variaciones triviales compartan caché."""
+    if input_type == "Texto":
+        return " ".join(prompt.split())
+    partes = urlsplit(prompt.strip())
+    return urlunsplit((
+        partes.scheme.lower(), partes.netloc.lower(), partes.path.rstrip("/"), partes.query, ""
+    ))
+
+
+class ResultadoFabric:
+    """Resultado de una ejecución; compatible con los campos de CompletedProcess."""
+
+    def __init__(self, returncode, stdout, stderr, tiempo_primer_token, duracion, desde_cache=False,
+                 terminado_por=None):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.tiempo_primer_token = tiempo_primer_token
+        self.duracion = duracion
+        self.desde_cache = desde_cache
+        # None si terminó por sí solo; "timeout" o "cancelado" si hubo que matarlo
+        self.terminado_por = terminado_por
+
+
+class CacheRespuestas:
+    """Caché persistente de respuestas de fabric con caducidad y expulsión LRU.
+
+    Cada respuesta se guarda en un JSON cuyo nombre es el hash de la invocación;
+    la fecha de modificación del archivo marca su último uso.
+    """
+
+    def __init__(self, directorio=None, ttl=None, max_entradas=None):
+        self.directorio = directorio or CACHE_DIR_DEFECTO
+        self.ttl = ttl or CACHE_TTL_DEFECTO
+        self.max_entradas = max_entradas or CACHE_MAX_ENTRADAS_DEFECTO
+        self.aciertos = 0
+        self.fallos = 0
+        self._bloqueo = threading.Lock()
+        os.makedirs(self.directorio, exist_ok=True)
+
+    @staticmethod
+    def clave(input_type, prompt, fabric_command, model_name, idioma="es"):
+        datos = json.dumps(
+            [input_type, normalizar_entrada(input_type, prompt), fabric_command, model_name, idioma]
+        )
+        return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.json")
+
+    def obtener(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            datos = None
+        if datos is not None and time.time() - datos["creado"] > self.ttl:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            datos = None
+        with self._bloqueo:
+            if datos is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+        os.utime(ruta)
+        return ResultadoFabric(0, datos["stdout"], "", 0.0, 0.0, desde_cache=True)
+
+    def guardar(self, clave, resultado):
+        if resultado.returncode != 0:
+            return
+        ruta = self._ruta(clave)
+        with escritura_atomica(ruta) as temporal, open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"creado": time.time(), "stdout": resultado.stdout}, f, ensure_ascii=False)
+        self._expulsar()
+
+    def _entradas(self):
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".json"):
+                try:
+                    entradas.append((os.path.getmtime(os.path.join(self.directorio, nombre)), nombre))
+                except FileNotFoundError:
+                    continue
+        return entradas
+
+    def _expulsar(self):
+        entradas = sorted(self._entradas())
+        for _, nombre in entradas[:max(0, len(entradas) - self.max_entradas)]:
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+            except FileNotFoundError:
+                pass
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas()),
+            "max_entradas": self.max_entradas,
+            "ttl": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / total if total else 0.0,
+        }
+
+
+# Grupo al que se apuntan las ejecuciones lanzadas desde el hilo actual
+_contexto = threading.local()
+
+
+class GrupoEjecuciones:
+    """Ejecuciones de fabric de una misma tarea, para poder detenerlas juntas.
+
+    Las funciones que corren en un pool no devuelven su `EjecucionFabric`
+    hasta terminar, así que cada una se apunta al grupo activo en su hilo en
+    cuanto arranca; `cancelar()` mata las que sigan en marcha y las que se
+    lancen después.
+    """
+
+    def __init__(self):
+        self.cancelado = False
+        self._ejecuciones = []
+        self._bloqueo = threading.Lock()
+
+    @contextmanager
+    def activar(self):
+        anterior = getattr(_contexto, "grupo", None)
+        _contexto.grupo = self
+        try:
+            yield self
+        finally:
+            _contexto.grupo = anterior
+
+    def ejecutar(self, funcion, *args):
+        """Llama a `funcion(*args)` con el grupo activo (para enviarlo a un pool)."""
+        with self.activar():
+            return funcion(*args)
+
+    def apuntar(self, ejecucion):
+        with self._bloqueo:
+            self._ejecuciones = [e for e in self._ejecuciones if not e._futuro.done()]
+            self._ejecuciones.append(ejecucion)
+            if self.cancelado:
+                ejecucion.cancelar()
+
+    def cancelar(self):
+        with self._bloqueo:
+            self.cancelado = True
+            ejecuciones = list(self._ejecuciones)
+        for ejecucion in ejecuciones:
+            ejecucion.cancelar()
+
+
+class EjecucionFabric:
+    """Lanza fabric por una tubería y lee su salida en segundo plano.
+
+    El proceso corre en un bucle de asyncio compartido, en su propio hilo, que
+    decodifica stdout a medida que llega y deja los fragmentos en una cola, de
+    la que el hilo de Streamlit los consume con `fragmentos()`. Si no termina
+    en `timeout` segundos o se llama a `cancelar()`, se mata su grupo de
+    procesos entero (bash, fabric y el resto de la tubería).
+    """
+
+    def __init__(self, comando, entrada=None, timeout=None, registrar=True):
+        self.comando = comando
+        self.registrar = registrar
+        self.descripcion = describir_comando(comando, entrada)
+        self.timeout = FABRIC_TIMEOUT_DEFECTO if timeout is None else timeout
+        self.inicio = time.time()
+        self.tiempo_primer_token = None
+        self.duracion = None
+        self.terminado_por = None
+        self._cola = queue.Queue()
+        self._salida = []
+        self._errores = []
+        self._cancelado = None
+        self._cancelacion_pedida = False
+        self._bucle = _bucle_subprocesos()
+        self._futuro = asyncio.run_coroutine_threadsafe(self._ejecutar(entrada), self._bucle)
+        grupo = getattr(_contexto, "grupo", None)
+        if grupo is not None:
+            grupo.apuntar(self)
+
+    async def _ejecutar(self, entrada):
+        try:
+            self._cancelado = asyncio.Event()
+            if self._cancelacion_pedida:
+                self._cancelado.set()
+            proceso = await asyncio.create_subprocess_exec(
+                "bash", "-c", self.comando,
+                stdin=asyncio.subprocess.PIPE if entrada is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                # Grupo de procesos propio para poder matar la tubería completa
+                start_new_session=True,
+            )
+            tareas = [self._leer_stdout(proceso.stdout), self._leer_stderr(proceso.stderr)]
+            if entrada is not None:
+                tareas.append(self._escribir_stdin(proceso.stdin, entrada))
+            trabajo = asyncio.ensure_future(asyncio.gather(*tareas, proceso.wait()))
+            cancelacion = asyncio.ensure_future(self._cancelado.wait())
+            hechas, _ = await asyncio.wait(
+                {trabajo, cancelacion}, timeout=self.timeout or None, return_when=asyncio.FIRST_COMPLETED
+            )
+            cancelacion.cancel()
+            if trabajo not in hechas:
+                self.terminado_por = "cancelado" if cancelacion in hechas else "timeout"
+                await self._terminar(proceso)
+                try:
+                    await asyncio.wait_for(trabajo, SEGUNDOS_GRACIA)
+                except asyncio.TimeoutError:
+                    pass
+            return await proceso.wait()
+        finally:
+            self.duracion = time.time() - self.inicio
+            self._cola.put(None)
+
+    async def _terminar(self, proceso):
+        """SIGTERM al grupo y, pasada la gracia, SIGKILL a lo que siga vivo en él."""
+        try:
+            os.killpg(proceso.pid, signal.SIGTERM)
+            await asyncio.wait_for(proceso.wait(), SEGUNDOS_GRACIA)
+        except (ProcessLookupError, asyncio.TimeoutError):
+            pass
+        try:
+            os.killpg(proceso.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def _escribir_stdin(self, stdin, entrada):
+        try:
+            stdin.write(entrada.encode("utf-8"))
+            await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stdin.close()
+
+    async def _leer_stdout(self, stdout):
+        decodificador = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            datos = await stdout.read(4096)
+            if not datos:
+                break
+            texto = decodificador.decode(datos)
+            if texto:
+                if self.tiempo_primer_token is None:
+                    self.tiempo_primer_token = time.time() - self.inicio
+                self._salida.append(texto)
+                self._cola.put(texto)
+        resto = decodificador.decode(b"", final=True)
+        if resto:
+            self._salida.append(resto)
+            self._cola.put(resto)
+
+    async def _leer_stderr(self, stderr):
+        self._errores.append((await stderr.read()).decode("utf-8", errors="replace"))
+
+    def fragmentos(self, intervalo=None):
+        """Genera los fragmentos de salida en el orden en que llegan.
+
+        Con `intervalo`, si en ese tiempo no llega nada genera una cadena vacía
+        para que quien consume pueda atender otras cosas (p. ej. una cancelación).
+        """
+        while True:
+            try:
+                fragmento = self._cola.get(timeout=intervalo)
+            except queue.Empty:
+                yield ""
+                continue
+            if fragmento is None:
+                return
+            yield fragmento
+
+    def cancelar(self):
+        """Pide detener la ejecución; se puede llamar desde cualquier hilo."""
+        self._bucle.call_soon_threadsafe(self._pedir_cancelacion)
+
+    def _pedir_cancelacion(self):
+        self._cancelacion_pedida = True
+        if self._cancelado is not None:
+            self._cancelado.set()
+
+    def esperar(self):
+        """Espera a que fabric termine, registra sus latencias y devuelve el resultado."""
+        returncode = self._futuro.result()
+        stderr = "".join(self._errores)
+        if self.terminado_por == "timeout":
+            stderr += f"\nFabric no terminó en {self.timeout:g} s y se detuvo."
+        elif self.terminado_por == "cancelado":
+            stderr += "\nEjecución cancelada por el usuario."
+        resultado = ResultadoFabric(
+            returncode,
+            "".join(self._salida),
+            stderr.strip(),
+            self.tiempo_primer_token,
+            self.duracion,
+            terminado_por=self.terminado_por,
+        )
+        if not self.registrar:
+            return resultado
+        metricas.registrar("fabric", {
+            **self.descripcion,
+            "returncode": resultado.returncode,
+            "terminado_por": resultado.terminado_por,
+            "tiempo_primer_token": resultado.tiempo_primer_token,
+            "duracion": resultado.duracion,
+            "bytes_salida": len(resultado.stdout.encode("utf-8")),
+        })
+        return resultado
+
+
+def separar_entradas(texto, input_type):
+    """Divide la lista pegada o subida en entradas individuales.
+
+    Las URLs van una por línea y las que empiezan por `#` se toman como
+    comentarios; los textos se separan con una línea que solo contenga `---` y
+    se conservan enteros (un texto puede empezar con un título `# ...`).
+    """
+    if input_type == "Texto":
+        bloques = re.split(r"^\s*---\s*$", texto, flags=re.MULTILINE)
+        return [b.strip() for b in bloques if b.strip()]
+    lineas = texto.splitlines()
+    return [linea.strip() for linea in lineas if linea.strip() and not linea.strip().startswith("#")]
+
+
+def ejecutar_fabric(comando, entrada=None, timeout=None, registrar=True):
+    """Ejecuta fabric hasta el final sin mostrar la salida parcial.
+
+    Con `registrar=False` la ejecución no cuenta en las métricas de Fabric.
+    """
+    ejecucion = EjecucionFabric(comando, entrada, timeout, registrar)
+    for _ in ejecucion.fragmentos():
+        pass
+    return ejecucion.esperar()
+
+
+def ejecutar_lote(funcion, elementos, concurrencia=4, intervalo=None):
+    """Aplica `funcion` a cada elemento en un pool de hilos.
+
+    Genera tuplas (indice, resultado) según van terminando, para que el hilo de
+    Streamlit pueda ir actualizando el progreso de cada elemento. Si `funcion`
+    lanza una excepción, ese elemento se devuelve como un `ResultadoFabric`
+    fallido con el mensaje en stderr y el resto del lote sigue informando.
+
+    Con `intervalo`, si en ese tiempo no termina ningún elemento se genera
+    (None, None), para que quien consume pueda repintar y Streamlit tenga
+    ocasión de detener el script. Si se deja de leer el lote antes de acabar,
+    los elementos en cola se descartan y los fabric en marcha se matan sin
+    esperar a que terminen.
+    """
+    grupo = GrupoEjecuciones()
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrencia))
+    futuros = {pool.submit(grupo.ejecutar, funcion, elemento): i for i, elemento in enumerate(elementos)}
+    pendientes = set(futuros)
+    try:
+        while pendientes:
+            hechos, pendientes = wait(pendientes, timeout=intervalo, return_when=FIRST_COMPLETED)
+            if not hechos:
+                yield None, None
+            for futuro in hechos:
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    resultado = ResultadoFabric(1, "", f"{type(e).__name__}: {e}", None, 0.0)
+                yield futuros[futuro], resultado
+    finally:
+        if pendientes:
+            for futuro in pendientes:
+                futuro.cancel()
+            grupo.cancelar()
+        pool.shutdown(wait=not pendientes)
+
+
+def contar_tokens(texto):
+    """Aproxima los tokens de un texto (≈ 4 tokens por cada 3 palabras)."""
+    return len(texto.split()) * 4 // 3
+
+
+def dividir_en_fragmentos(texto, max_tokens=3000, solapamiento=200):
+    """Divide el texto en fragmentos de ~max_tokens que se solapan en ~solapamiento.
+
+    Se corta por palabras para no partir ninguna a la mitad, conservando los
+    espacios y saltos de línea originales, y cuando se puede en un cambio de
+    párrafo; el solapamiento conserva contexto entre un fragmento y el siguiente.
+    """
+    # Palabras en las posiciones pares y el espacio que las separa en las impares
+    partes = re.split(r"(\s+)", texto.strip())
+    n_palabras = (len(partes) + 1) // 2 if partes != [""] else 0
+    por_fragmento = max(1, max_tokens * 3 // 4)
+    solape = min(max(0, solapamiento * 3 // 4), por_fragmento - 1)
+    fragmentos = []
+    inicio = 0
+    while inicio < n_palabras:
+        fin = min(inicio + por_fragmento, n_palabras)
+        if fin < n_palabras:
+            # Último salto de párrafo de la segunda mitad del fragmento, si lo hay
+            minimo = max(inicio + solape, inicio + por_fragmento // 2) + 1
+            for j in range(fin, minimo - 1, -1):
+                if "\n\n" in partes[2 * j - 1]:
+                    fin = j
+                    break
+        fragmentos.append("".join(partes[2 * inicio:2 * fin - 1]))
+        if fin >= n_palabras:
+            break
+        inicio = fin - solape
+    return fragmentos
+
+
+def _aplicar_patron(textos, fabric_command, model_name, concurrencia, timeout, al_avanzar):
+    """Pasa cada texto por el patrón en paralelo y genera (indice, resultado).
+
+    Mientras espera llama a `al_avanzar(hechos, total)` cada medio segundo, y
+    así el hilo de Streamlit puede detener el script (y con él los fabric).
+    """
+    comando = construir_comando("Texto", None, fabric_command, model_name)
+    hechos = 0
+    lote = ejecutar_lote(
+        lambda texto: ejecutar_fabric(comando, texto, timeout), textos, concurrencia,
+        0.5 if al_avanzar else None,
+    )
+    for i, resultado in lote:
+        if i is not None:
+            hechos += 1
+            yield i, resultado
+        if al_avanzar:
+            al_avanzar(hechos, len(textos))
+
+
+def procesar_por_fragmentos(texto, fabric_command, model_name, max_tokens=3000, solapamiento=200,
+                            concurrencia=4, combinar_con_patron=True, al_avanzar=None, timeout=None):
+    """Aplica el patrón a cada fragmento en paralelo (map) y une los parciales (reduce).
+
+    Si `combinar_con_patron` es verdadero, los resultados parciales se vuelven a
+    pasar por el mismo patrón (a su vez por fragmentos si no caben); si no, se
+    concatenan. `al_avanzar(hechos, total)` se llama desde el hilo de Streamlit.
+    `timeout` limita cada llamada a fabric, no el proceso entero.
+    """
+    inicio = time.time()
+    fragmentos = dividir_en_fragmentos(texto, max_tokens, solapamiento)
+    parciales = [None] * len(fragmentos)
+
+    for i, resultado in _aplicar_patron(fragmentos, fabric_command, model_name, concurrencia, timeout, al_avanzar):
+        if resultado.returncode != 0:
+            return resultado
+        parciales[i] = resultado.stdout.strip()
+
+    resultado = combinar_parciales(
+        parciales, fabric_command, model_name, max_tokens, solapamiento, concurrencia,
+        combinar_con_patron, contar_tokens(texto), al_avanzar, timeout,
+    )
+    resultado.duracion = time.time() - inicio
+    return resultado
+
+
+def combinar_parciales(parciales, fabric_command, model_name, max_tokens=3000, solapamiento=200,
+                       concurrencia=4, combinar_con_patron=True, tokens_originales=None, al_avanzar=None,
+                       timeout=None):
+    """Paso reduce: une los resultados parciales de los fragmentos en uno solo."""
+    unido = "\n\n---\n\n".join(parciales)
+    if len(parciales) == 1 or not combinar_con_patron:
+        return ResultadoFabric(0, unido, "", None, 0.0)
+    tokens_unido = contar_tokens(unido)
+    if tokens_unido > max_tokens and (tokens_originales is None or tokens_unido < tokens_originales):
+        return procesar_por_fragmentos(
+            unido, fabric_command, model_name, max_tokens, solapamiento, concurrencia, True, al_avanzar, timeout
+        )
+    for _, resultado in _aplicar_patron([unido], fabric_command, model_name, 1, timeout, al_avanzar):
+        return resultado
+
+
+class ProcesadorIncremental:
+    """Aplica un patrón a un texto que llega por partes, sin esperar al final.
+
+    Cada vez que se acumulan `max_tokens` se lanza fabric sobre ese fragmento
+    en un pool de fondo (el texto entra por stdin); `terminar()` envía el resto
+    y combina los parciales como en `procesar_por_fragmentos`. Usado como
+    gestor de contexto, si el bloque sale por una excepción (o Streamlit
+    detiene el script) se llama a `cancelar()`.
+    """
+
+    def __init__(self, fabric_command, model_name, max_tokens=3000, concurrencia=4, combinar_con_patron=True,
+                 timeout=None):
+        self.fabric_command = fabric_command
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.concurrencia = concurrencia
+        self.combinar_con_patron = combinar_con_patron
+        self.timeout = timeout
+        self.inicio = time.time()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrencia))
+        self._futuros = []
+        self._grupo = GrupoEjecuciones()
+        self._pendiente = []
+        self._tokens_pendientes = 0
+        self._tokens_totales = 0
+
+    def agregar(self, texto):
+        tokens = contar_tokens(texto)
+        self._pendiente.append(texto.strip())
+        self._tokens_pendientes += tokens
+        self._tokens_totales += tokens
+        if self._tokens_pendientes >= self.max_tokens:
+            self._enviar()
+
+    def _enviar(self):
+        fragmento = " ".join(self._pendiente).strip()
+        self._pendiente = []
+        self._tokens_pendientes = 0
+        if fragmento:
+            comando = construir_comando("Texto", None, self.fabric_command, self.model_name)
+            self._futuros.append(self._pool.submit(self._grupo.ejecutar, ejecutar_fabric, comando, fragmento, self.timeout))
+
+    def enviados(self):
+        return len(self._futuros)
+
+    def completados(self):
+        return sum(1 for futuro in self._futuros if futuro.done())
+
+    def terminar(self):
+        """Procesa lo que quede pendiente y devuelve el resultado combinado."""
+        self._enviar()
+        resultados = [futuro.result() for futuro in self._futuros]
+        self._pool.shutdown()
+        for resultado in resultados:
+            if resultado.returncode != 0:
+                return resultado
+        if not resultados:
+            return ResultadoFabric(1, "", "No se recibió texto que procesar", None, time.time() - self.inicio)
+        resultado = combinar_parciales(
+            [r.stdout.strip() for r in resultados], self.fabric_command, self.model_name,
+            self.max_tokens, 200, self.concurrencia, self.combinar_con_patron, self._tokens_totales,
+            timeout=self.timeout,
+        )
+        resultado.duracion = time.time() - self.inicio
+        return resultado
+
+    def cancelar(self):
+        """Descarta los fragmentos aún en cola y detiene los fabric que sigan en marcha."""
+        for futuro in self._futuros:
+            futuro.cancel()
+        self._grupo.cancelar()
+        self._pool.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if tipo is not None:
+            self.cancelar()
@@ -0,0 +1,81 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from archivos import escritura_atomica
+
+
+def pdf_actualizado(markdown_file, pdf_file):
+    """Indica si el PDF existe y es posterior a su markdown de origen."""
+    try:
+        return os.path.getmtime(pdf_file) >= os.path.getmtime(markdown_file)
+    except FileNotFoundError:
+        return False
+
+
+class GeneradorPDFs:
+    """Regenera en segundo plano los PDF que faltan o están desactualizados.
+
+    `asegurar` nunca bloquea: si el PDF está al día devuelve True y, si no,
+    encarga su generación al pool (una sola vez por archivo) y devuelve False.
+    Si la conversión falla no se reintenta hasta que cambie el markdown; el
+    motivo queda disponible en `error`.
+    """
+
+    def __init__(self, convertir, trabajadores=2):
+        self.convertir = convertir
+        self._pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="pdf")
+        self._en_curso = set()
+        # pdf_file -> (mtime del markdown que falló, mensaje)
+        self._fallidos = {}
+        self._bloqueo = threading.Lock()
+
+    def asegurar(self, markdown_file, pdf_file):
+        if pdf_actualizado(markdown_file, pdf_file):
+            return True
+        with self._bloqueo:
+            if pdf_file in self._en_curso or self._fallo_vigente(markdown_file, pdf_file):
+                return False
+            self._fallidos.pop(pdf_file, None)
+            self._en_curso.add(pdf_file)
+        self._pool.submit(self._generar, markdown_file, pdf_file)
+        return False
+
+    def _generar(self, markdown_file, pdf_file):
+        # Se escribe a un temporal para no servir nunca un PDF a medias
+        try:
+            with escritura_atomica(pdf_file) as temporal:
+                self.convertir(markdown_file, temporal)
+        except FileNotFoundError:
+            # El markdown se borró mientras esperaba su turno
+            pass
+        except Exception as e:
+            try:
+                mtime = os.path.getmtime(markdown_file)
+            except FileNotFoundError:
+                mtime = None
+            with self._bloqueo:
+                self._fallidos[pdf_file] = (mtime, f"{type(e).__name__}: {e}")
+        finally:
+            with self._bloqueo:
+                self._en_curso.discard(pdf_file)
+
+    def _fallo_vigente(self, markdown_file, pdf_file):
+        fallo = self._fallidos.get(pdf_file)
+        if fallo is None:
+            return False
+        try:
+            return fallo[0] == os.path.getmtime(markdown_file)
+        except FileNotFoundError:
+            return False
+
+    def error(self, markdown_file, pdf_file):
+        """Motivo del último fallo al generar el PDF, si el markdown no ha cambiado desde entonces."""
+        with self._bloqueo:
+            if self._fallo_vigente(markdown_file, pdf_file):
+                return self._fallidos[pdf_file][1]
+        return None
+
+    def pendientes(self):
+        with self._bloqueo:
+            return len(self._en_curso)
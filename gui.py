@@ -1,84 +1,298 @@
+import time
+
+_inicio_importaciones = time.perf_counter()
+
 import streamlit as st
-import subprocess
-import base64
 import os
+import sys
 from datetime import datetime
-import re
-import shlex  # Importamos shlex para manejar el escape de caracteres
-from fpdf import FPDF
-import whisper
-import tempfile
+from itertools import islice
+import metricas
+from whisper_modelos import RegistroModelos
+from motores_transcripcion import MOTORES
+from planificador import PlanificadorInferencia
+from fabric_runner import (
+    FABRIC_TIMEOUT_DEFECTO,
+    CacheRespuestas,
+    EjecucionFabric,
+    construir_comando,
+    ejecutar_fabric,
+    contar_tokens,
+    dividir_en_fragmentos,
+    ejecutar_lote,
+    procesar_por_fragmentos,
+    separar_entradas,
+    ProcesadorIncremental,
+)
+from generador_pdf import GeneradorPDFs
+from indice_resultados import IndiceResultados
+from preprocesado import extraer_audio, liberar_audio, reservar_audio, sondear_medio
+from subidas import SubidaEnDisco, limpiar_subidas_huerfanas
+from subtitulos import a_texto, exportar_en_cache, resegmentar
+from trabajos import ColaTrabajos
+from transcripcion import (
+    CacheTranscripciones,
+    PoolParalelo,
+    registrar_metricas,
+)
+
+# Whisper (y con él torch) y fpdf se importan de forma diferida, solo al usarlos
+TIEMPO_IMPORTACIONES = time.perf_counter() - _inicio_importaciones
+
+# Presupuesto de tiempo de importación para la página de Fabric (en ms)
+PRESUPUESTO_ARRANQUE_MS = int(os.environ.get("PRESUPUESTO_ARRANQUE_MS", "1500"))
+
+
+@st.cache_resource
+def get_arranque(_pagina):
+    """Registra una vez por proceso el tiempo de importación de la primera ejecución."""
+    arranque = {
+        "pagina": _pagina,
+        "importaciones_ms": TIEMPO_IMPORTACIONES * 1000,
+        "presupuesto_ms": PRESUPUESTO_ARRANQUE_MS,
+        "whisper_cargado": "whisper" in sys.modules,
+        "torch_cargado": "torch" in sys.modules,
+        "fpdf_cargado": "fpdf" in sys.modules,
+    }
+    metricas.registrar("arranque", arranque)
+    return arranque
+
+
+TIPOS_MIME = {
+    ".md": "text/markdown",
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+    ".srt": "text/plain",
+    ".vtt": "text/vtt",
+}
 
 
-class PDF(FPDF):
-    def header(self):
-        self.set_font("Arial", "B", 12)
-        self.cell(0, 10, "Generado por Fabric AI", 0, 1, "C")
+def boton_descarga(filepath, file_label, key=None, contenedor=st):
+    """Botón de descarga servido por Streamlit como archivo, no incrustado en la página."""
+    with open(filepath, "rb") as f:
+        contenedor.download_button(
+            f"Descargar {file_label}",
+            f,
+            file_name=file_label,
+            mime=TIPOS_MIME.get(os.path.splitext(file_label)[1], "application/octet-stream"),
+            key=key or f"descarga_{filepath}",
+        )
 
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Arial", "I", 8)
-        self.cell(0, 10, f"Página {self.page_no()}", 0, 0, "C")
+
+def _preparar_descarga(filepath):
+    st.session_state[f"descarga_preparada_{filepath}"] = True
+
+
+def boton_descarga_diferida(filepath, file_label, contenedor=st):
+    """Solo lee el archivo cuando el usuario pide descargarlo.
+
+    Útil en listados largos: mientras no se pulsa "Preparar", la página solo
+    lleva un botón y ningún byte del archivo.
+    """
+    if st.session_state.get(f"descarga_preparada_{filepath}") and os.path.exists(filepath):
+        boton_descarga(filepath, file_label, key=f"descarga_diferida_{filepath}", contenedor=contenedor)
+    else:
+        contenedor.button(
+            f"Preparar descarga de {file_label}",
+            key=f"preparar_{filepath}",
+            on_click=_preparar_descarga,
+            args=(filepath,),
+        )
 
 
-def get_binary_file_downloader_html(bin_file, file_label="File"):
-    with open(bin_file, "rb") as f:
-        data = f.read()
-    bin_str = base64.b64encode(data).decode()
-    href = f'<a href="data:application/octet-stream;base64,{bin_str}" download="{file_label}">Descargar {file_label}</a>'
-    return href
+@st.cache_resource
+def get_registro_modelos():
+    """Registro de modelos Whisper compartido por todas las sesiones del servidor."""
+    return RegistroModelos()
 
 
-def get_file_description(filepath):
+@st.cache_resource
+def get_planificador():
+    """Planificador que decodifica por lotes los trozos de todas las sesiones con un único dueño del modelo."""
+    return PlanificadorInferencia(get_registro_modelos())
+
+
+@st.cache_resource
+def get_cache_transcripciones():
+    """Caché persistente de transcripciones compartida por todas las sesiones."""
+    return CacheTranscripciones()
+
+
+@st.cache_resource
+def get_pool_paralelo():
+    """Único pool de procesos de transcripción del servidor, dentro del presupuesto de memoria."""
+    return PoolParalelo(get_registro_modelos().presupuesto_mb)
+
+
+def get_transcriptor_paralelo(modelo="base", procesos=2, motor="whisper"):
+    """Pool de procesos de transcripción (con su modelo ya cargado) reutilizado entre sesiones."""
+    return get_pool_paralelo().obtener(modelo, procesos, motor)
+
+
+def obtener_subida(archivo, clave="transcripcion"):
+    """Vuelca la subida a disco una sola vez y la comparte entre todas las acciones.
+
+    Al cambiar o quitar el archivo del uploader se borra el volcado anterior.
+    """
+    actual = st.session_state.get(f"subida_{clave}")
+    if archivo is None:
+        if actual is not None:
+            actual.cerrar()
+            del st.session_state[f"subida_{clave}"]
+        return None
+    identificador = getattr(archivo, "file_id", archivo.name)
+    if actual is not None and actual.identificador == identificador:
+        return actual
+    if actual is not None:
+        actual.cerrar()
+    subida = SubidaEnDisco(archivo, identificador)
+    st.session_state[f"subida_{clave}"] = subida
+    return subida
+
+
+@st.cache_resource
+def limpiar_subidas_al_arrancar():
+    """Borra, una vez por proceso, los volcados que dejó un proceso anterior."""
+    limpiar_subidas_huerfanas()
+    return True
+
+
+def obtener_audio(archivo, clave="transcripcion"):
+    """Ruta de la pista de audio a 16 kHz mono de la subida, extraída una sola vez."""
+    subida = obtener_subida(archivo, clave)
+    if getattr(subida, "ruta_audio", None) is None or not os.path.exists(subida.ruta_audio):
+        subida.ruta_audio = extraer_audio(subida.ruta, subida.hash)
+    return subida.ruta_audio
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def sondear_contenido(hash_, _ruta):
+    """Metadatos del medio leídos de sus cabeceras, cacheados por huella de la subida."""
+    return sondear_medio(_ruta)
+
+
+def sondear_subida(archivo, clave="transcripcion"):
+    subida = obtener_subida(archivo, clave)
+    try:
+        return sondear_contenido(subida.hash, subida.ruta)
+    except Exception:
+        return None
+
+
+def hash_archivo(archivo, clave="transcripcion"):
+    """Huella del contenido, calculada en la misma pasada que el volcado a disco."""
+    return obtener_subida(archivo, clave).hash
+
+
+def transcribir_en_vivo(archivo, modelo="base", idioma="es", procesos=1, clave="transcripcion", motor="whisper"):
+    """Transcribe una subida una sola vez, mostrando los segmentos a medida que salen.
+
+    Si la huella ya está en la caché se devuelve al instante. Si no, se pinta
+    una barra de progreso (segundos de audio procesados frente a la duración)
+    con ETA y el texto parcial; el botón "Detener" interrumpe el script y lo
+    ya transcrito queda en `st.session_state["transcripcion_parcial"]`.
+    """
+    subida = obtener_subida(archivo, clave)
+    hash_ = subida.hash
+    cache = get_cache_transcripciones()
+    resultado = cache.obtener(hash_, modelo, idioma, motor)
+    if resultado is not None:
+        st.session_state["medicion_transcripcion"] = None
+        return resultado
+
+    st.button("Detener transcripción", key="detener_transcripcion")
+    barra = st.progress(0.0, text="Extrayendo el audio...")
+    inicio_trabajo = time.time()
+    ruta_audio = obtener_audio(archivo, clave)
+    tiempo_extraccion = time.time() - inicio_trabajo
+    texto_parcial = st.empty()
+    segmentos = []
+    st.session_state["transcripcion_parcial"] = {"nombre": archivo.name, "segments": segmentos}
+    duracion = 0.0
+    tiempos = {}
+    inicio = time.time()
+    if procesos > 1:
+        bloques = get_transcriptor_paralelo(modelo, procesos, motor).transcribir_por_trozos(
+            ruta_audio, idioma, tiempos=tiempos, palabras=True
+        )
+    else:
+        bloques = get_planificador().transcribir_por_trozos(
+            ruta_audio, modelo, idioma, motor, tiempos=tiempos, palabras=True
+        )
+    for nuevos, procesados, duracion in bloques:
+        segmentos.extend(nuevos)
+        transcurrido = time.time() - inicio
+        restante = transcurrido * (duracion - procesados) / procesados if procesados else 0.0
+        barra.progress(
+            min(1.0, procesados / duracion) if duracion else 1.0,
+            text=f"Audio procesado: {procesados:.0f} de {duracion:.0f} s · tiempo restante estimado: {restante:.0f} s",
+        )
+        texto_parcial.text_area("Transcripción en curso", a_texto(segmentos, "txt"), height=300)
+
+    barra.empty()
+    texto_parcial.empty()
+    st.session_state.pop("transcripcion_parcial", None)
+    resultado = {
+        "text": "".join(s["text"] for s in segmentos),
+        "language": idioma,
+        "segments": segmentos,
+        "duration": duracion,
+        "tiempo_inferencia": time.time() - inicio,
+        "modelo": modelo,
+        "motor": motor,
+    }
+    cache.guardar(hash_, modelo, idioma, resultado, motor)
+    # La extracción con ffmpeg cuenta como parte de la decodificación del audio
+    tiempos["decodificacion_audio"] += tiempo_extraccion
+    st.session_state["medicion_transcripcion"] = registrar_metricas(
+        resultado, tiempos, time.time() - inicio_trabajo, procesos=procesos, origen="interfaz"
+    )
+    return resultado
+
+
+def transcripcion_guardada(archivo, modelo="base", idioma="es", motor="whisper"):
+    """Transcripción de la caché sin transcribir; se recuerda en la sesión para no releerla en cada rerun."""
+    clave = (hash_archivo(archivo), modelo, idioma, motor)
+    guardada = st.session_state.get("transcripcion_guardada")
+    if guardada is None or guardada[0] != clave:
+        resultado = get_cache_transcripciones().obtener(*clave)
+        if resultado is None:
+            return None
+        st.session_state["transcripcion_guardada"] = (clave, resultado)
+        return resultado
+    return guardada[1]
+
+
+def obtener_transcripcion(archivo, modelo="base", procesos=1, motor="whisper", idioma="es"):
+    return transcribir_en_vivo(archivo, modelo, idioma, procesos=procesos, motor=motor)
+
+
+def transcribir_archivo(archivo, modelo="base", procesos=1, motor="whisper"):
+    return obtener_transcripcion(archivo, modelo, procesos, motor)["text"]
+
+def exportar_subtitulos(archivo, formato, modelo="base", procesos=1, motor="whisper", disposicion=None, idioma="es"):
+    """Escribe los subtítulos a disco una vez por transcripción y disposición y devuelve su ruta.
+
+    Con `disposicion` (argumentos de `resegmentar`) los subtítulos se rehacen a
+    partir de las palabras de la transcripción en caché, sin volver a transcribir.
+    """
+    segmentos = obtener_transcripcion(archivo, modelo, procesos, motor, idioma)["segments"]
+    clave = f"{hash_archivo(archivo)}_{motor}-{modelo}_{idioma}"
+    if disposicion:
+        segmentos = resegmentar(segmentos, **disposicion)
+        clave += "_" + "-".join(str(valor) for valor in disposicion.values())
+    return exportar_en_cache(segmentos, clave, formato)
+
+def generar_srt(archivo, modelo="base", procesos=1, motor="whisper", disposicion=None):
+    return exportar_subtitulos(archivo, "srt", modelo, procesos, motor, disposicion)
+
+def generar_subtitulos_txt(archivo, modelo="base", procesos=1, motor="whisper", disposicion=None):
+    return exportar_subtitulos(archivo, "txt", modelo, procesos, motor, disposicion)
+
+def contar_lineas(filepath):
+    """Cuenta las líneas de un archivo leyéndolo por partes."""
     with open(filepath, "r", encoding="utf-8") as f:
-        content = f.read()
-    match = re.search(r"# RESUMEN\s*(.*?)\s*# IDEAS", content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return "No se encontró descripción"
-
-
-def transcribir_archivo(archivo, modelo="base"):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(archivo.name)[1]) as temp:
-        temp.write(archivo.read())
-        temp_path = temp.name
-    model = whisper.load_model(modelo)
-    result = model.transcribe(temp_path, language="es")
-    os.remove(temp_path)
-    return result["text"]
-
-def generar_srt(archivo, modelo="base"):
-    def format_timestamp(seconds):
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds - int(seconds)) * 1000)
-        return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(archivo.name)[1]) as temp:
-        temp.write(archivo.read())
-        temp_path = temp.name
-    model = whisper.load_model(modelo)
-    result = model.transcribe(temp_path, language="es")
-    os.remove(temp_path)
-    segments = result.get("segments", [])
-    srt_content = ""
-    for i, segment in enumerate(segments, 1):
-        start = format_timestamp(segment["start"])
-        end = format_timestamp(segment["end"])
-        text = segment["text"].strip()
-        srt_content += f"{i}\n{start} --> {end}\n{text}\n\n"
-    return srt_content
-
-def generar_subtitulos_txt(archivo, modelo="base"):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(archivo.name)[1]) as temp:
-        temp.write(archivo.read())
-        temp_path = temp.name
-    model = whisper.load_model(modelo)
-    result = model.transcribe(temp_path, language="es")
-    os.remove(temp_path)
-    segments = result.get("segments", [])
-    txt_content = "\n".join([segment["text"].strip() for segment in segments])
-    return txt_content
+        return sum(1 for _ in f)
 
 def format_time(seconds):
     return f"{seconds:.2f} s | {seconds/60:.2f} min | {seconds/3600:.2f} h"
@@ -90,6 +304,31 @@ def format_size(bytes_):
     return f"{bytes_:.0f} bytes | {kb:.2f} KB | {mb:.2f} MB | {gb:.4f} GB"
 
 
+def mostrar_medicion(medicion):
+    """Desglose por fases de la última transcripción ejecutada en esta sesión."""
+    if medicion is None:
+        st.write("- Transcripción recuperada de la caché (sin inferencia)")
+        return
+    st.write(f"- Carga del modelo: {format_time(medicion['tiempo_carga_modelo'])}")
+    st.write(f"- Decodificación del audio: {format_time(medicion['tiempo_decodificacion_audio'])}")
+    st.write(f"- Inferencia: {format_time(medicion['tiempo_inferencia'])}")
+    st.write(f"- Factor de tiempo real: {medicion['factor_tiempo_real'] or 0:.2f}x (segundos de audio por segundo)")
+    st.write(f"- Segmentos por segundo: {medicion['segmentos_por_segundo'] or 0:.2f}")
+
+
+# Modelos de LLM disponibles para Fabric
+FABRIC_MODELOS = ("gpt-4o-mini", "gpt-4-0125-preview", "claude-3-5-sonnet-20240620")
+
+# Trabajos en segundo plano que se recuerdan en la URL de cada pestaña
+MAX_TRABAJOS_URL = 20
+
+# Nombres legibles de los motores de transcripción
+DESCRIPCIONES_MOTORES = {
+    "whisper": "openai-whisper (PyTorch fp32)",
+    "faster-whisper": "faster-whisper (CTranslate2 int8, más rápido en CPU)",
+}
+
+
 # Diccionario de descripciones en español para los comandos más comunes de Fabric
 DESCRIPCIONES_ES = {
     # 1-50
@@ -324,13 +563,54 @@ DESCRIPCIONES_ES = {
 @st.cache_data(ttl=3600)  # Cache por una hora
 def get_fabric_options():
     """Obtiene las opciones de comandos de Fabric."""
-    resultado = subprocess.run(["fabric", "-l"], capture_output=True, text=True)
+    resultado = ejecutar_fabric("fabric -l", timeout=30, registrar=False)
     opciones = [line.strip() for line in resultado.stdout.split("\n") if line.strip()]
     # Filtrar para obtener solo comandos válidos (eliminar encabezados)
     opciones = [opt for opt in opciones if not opt.startswith("Available") and not opt.startswith("==")]
     return opciones
 
 
+@st.cache_resource
+def get_cache_respuestas():
+    """Caché persistente de respuestas de Fabric compartida por todas las sesiones."""
+    return CacheRespuestas()
+
+
+def ejecutar_fabric_en_vivo(comando, timeout=None):
+    """Ejecuta fabric pintando la salida parcial en la página a medida que llega.
+
+    Pulsar "Cancelar" relanza el script: Streamlit interrumpe el bucle en el
+    siguiente repintado y el `finally` detiene el grupo de procesos de fabric.
+    """
+    # Ejecutamos el comando usando 'bash' para interpretar el pipe y leemos la salida por partes
+    ejecucion = EjecucionFabric(comando, timeout=timeout)
+    st.button("Cancelar", key="cancelar_fabric")
+    salida_parcial = st.empty()
+    acumulado = ""
+    ultima_actualizacion = 0.0
+    terminado = False
+    try:
+        # Sin salida nueva también se repinta cada medio segundo para atender la cancelación
+        for fragmento in ejecucion.fragmentos(intervalo=0.5):
+            acumulado += fragmento
+            # Limitar los repintados para no saturar el websocket
+            if time.time() - ultima_actualizacion > 0.1:
+                salida_parcial.markdown(acumulado + "▌")
+                ultima_actualizacion = time.time()
+        terminado = True
+    finally:
+        if not terminado:
+            ejecucion.cancelar()
+            ejecucion.esperar()
+    resultado = ejecucion.esperar()
+    salida_parcial.empty()
+    if resultado.tiempo_primer_token is not None:
+        st.caption(
+            f"Primer token: {resultado.tiempo_primer_token:.2f} s | Tiempo total: {resultado.duracion:.2f} s"
+        )
+    return resultado
+
+
 def get_fabric_options_with_descriptions():
     """Obtiene los comandos de Fabric con descripciones en español."""
     comandos = get_fabric_options()
@@ -355,30 +635,194 @@ def extract_command(option_text):
 
 
 def markdown_to_pdf(markdown_file, pdf_file):
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-
-    with open(markdown_file, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    lines = content.split("\n")
-    for line in lines:
-        if line.startswith("# "):
-            pdf.set_font("Arial", "B", 16)
-            pdf.cell(
-                0, 10, line[2:].encode("latin-1", "replace").decode("latin-1"), ln=True
-            )
-        elif line.startswith("## "):
-            pdf.set_font("Arial", "B", 14)
-            pdf.cell(
-                0, 10, line[3:].encode("latin-1", "replace").decode("latin-1"), ln=True
-            )
-        else:
-            pdf.set_font("Arial", size=12)
-            pdf.multi_cell(0, 5, line.encode("latin-1", "replace").decode("latin-1"))
+    # fpdf solo se importa cuando realmente se genera un PDF
+    from exportar_pdf import markdown_to_pdf as _markdown_to_pdf
+
+    _markdown_to_pdf(markdown_file, pdf_file)
+
+
+@st.cache_resource
+def get_indice_resultados():
+    """Índice de metadatos de `resultados` compartido por todas las sesiones."""
+    return IndiceResultados("resultados")
+
+
+@st.cache_resource
+def get_generador_pdfs():
+    """Pool compartido que regenera en segundo plano los PDF pendientes."""
+    return GeneradorPDFs(markdown_to_pdf)
 
-    pdf.output(pdf_file)
+
+def guardar_resultado(contenido, filename, indice, patron=None, modelo=None):
+    """Guarda el resultado en `resultados` junto con su versión PDF y lo indexa."""
+    filepath = os.path.join("resultados", filename)
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(contenido)
+
+    pdf_filepath = os.path.join("resultados", filename.replace(".md", ".pdf"))
+    markdown_to_pdf(filepath, pdf_filepath)
+    indice.registrar(filename, patron, modelo)
+    return filepath, pdf_filepath
+
+
+def procesar_elemento_lote(trabajo):
+    """Ejecuta (o recupera de la caché) un elemento del lote y guarda su resultado."""
+    cache = trabajo["cache"]
+    clave = CacheRespuestas.clave(trabajo["input_type"], trabajo["entrada"], trabajo["patron"], trabajo["modelo"])
+    resultado = None if trabajo["ignorar_cache"] else cache.obtener(clave)
+    if resultado is None:
+        comando = construir_comando(trabajo["input_type"], trabajo["entrada"], trabajo["patron"], trabajo["modelo"])
+        resultado = ejecutar_fabric(comando, timeout=trabajo.get("timeout"))
+        cache.guardar(clave, resultado)
+    if resultado.returncode == 0:
+        guardar_resultado(
+            resultado.stdout, trabajo["filename"], trabajo["indice"], trabajo["patron"], trabajo["modelo"]
+        )
+    return resultado
+
+
+@st.cache_resource
+def get_cola_trabajos():
+    """Cola de trabajos en segundo plano compartida por todas las sesiones."""
+    cola = ColaTrabajos()
+    planificador = get_planificador()
+    cache_transcripciones = get_cache_transcripciones()
+    cache_respuestas = get_cache_respuestas()
+    indice = get_indice_resultados()
+
+    def trabajo_fabric(input_type, prompt, fabric_command, model_name, ignorar_cache, filename, timeout=None):
+        resultado = procesar_elemento_lote({
+            "cache": cache_respuestas,
+            "indice": indice,
+            "input_type": input_type,
+            "entrada": prompt,
+            "patron": fabric_command,
+            "modelo": model_name,
+            "ignorar_cache": ignorar_cache,
+            "filename": filename,
+            "timeout": timeout,
+        })
+        if resultado.returncode != 0:
+            raise RuntimeError(resultado.stderr)
+        return {"stdout": resultado.stdout, "filename": filename}
+
+    def trabajo_transcripcion(ruta, hash_, nombre, modelo="base", idioma="es", motor="whisper"):
+        try:
+            resultado = cache_transcripciones.obtener(hash_, modelo, idioma, motor)
+            if resultado is None:
+                tiempos = {}
+                inicio = time.time()
+                resultado = planificador.transcribir(ruta, modelo, idioma, motor, tiempos=tiempos, palabras=True)
+                cache_transcripciones.guardar(hash_, modelo, idioma, resultado, motor)
+                registrar_metricas(resultado, tiempos, time.time() - inicio, procesos=1, origen="segundo_plano")
+            return resultado
+        finally:
+            liberar_audio(ruta)
+
+    cola.registrar_tipo("fabric", trabajo_fabric)
+    cola.registrar_tipo("transcripcion", trabajo_transcripcion)
+    return cola
+
+
+def encolar_transcripcion(archivo, modelo="base", idioma="es", motor="whisper"):
+    """Extrae el audio de la subida y encola su transcripción en segundo plano."""
+    # Se reserva una copia de la pista: sobrevive a la sesión y a la limpieza de la caché de audio
+    hash_ = hash_archivo(archivo)
+    ruta = reservar_audio(obtener_audio(archivo))
+    return get_cola_trabajos().encolar(
+        "transcripcion",
+        {
+            "ruta": ruta,
+            "hash_": hash_,
+            "nombre": archivo.name,
+            "modelo": modelo,
+            "idioma": idioma,
+            "motor": motor,
+        },
+    )
+
+
+def mostrar_resultado_fabric(contenido, filename, key=None):
+    """Muestra el resultado de Fabric con los enlaces de descarga en md y PDF."""
+    st.subheader("Resultado:")
+    st.text_area("", value=contenido, height=300, key=key)
+
+    filepath = os.path.join("resultados", filename)
+    pdf_filename = filename.replace(".md", ".pdf")
+    pdf_filepath = os.path.join("resultados", pdf_filename)
+    col1, col2 = st.columns(2)
+    with col1:
+        boton_descarga(filepath, filename, key=f"{key}_md" if key else None)
+    with col2:
+        boton_descarga(pdf_filepath, pdf_filename, key=f"{key}_pdf" if key else None)
+
+
+def mostrar_transcripcion(resultado, nombre, key=""):
+    """Muestra una transcripción terminada con sus descargas en texto, SRT, VTT y TXT."""
+    base = os.path.splitext(nombre)[0]
+    st.text_area("Transcripción", resultado["text"], height=300, key=f"texto_{key}")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.download_button(
+            "Descargar transcripción", resultado["text"], f"{base}_transcripcion.txt", "text/plain",
+            key=f"desc_texto_{key}",
+        )
+    with col2:
+        st.download_button(
+            "Descargar subtítulos SRT", a_texto(resultado["segments"], "srt"), f"{base}.srt", "text/plain",
+            key=f"desc_srt_{key}",
+        )
+    with col3:
+        st.download_button(
+            "Descargar subtítulos VTT", a_texto(resultado["segments"], "vtt"), f"{base}.vtt", "text/vtt",
+            key=f"desc_vtt_{key}",
+        )
+    with col4:
+        st.download_button(
+            "Descargar subtítulos TXT", a_texto(resultado["segments"], "txt"), f"{base}_subtitulos.txt",
+            "text/plain", key=f"desc_txt_{key}",
+        )
+
+
+def trabajos_de_sesion(tipo):
+    """IDs de los trabajos encolados desde esta pestaña, recuperados de la URL tras recargar."""
+    clave = f"trabajos_{tipo}"
+    if clave not in st.session_state:
+        st.session_state[clave] = st.query_params.get_all(clave)
+    return st.session_state[clave]
+
+
+def recordar_trabajo(tipo, id_trabajo):
+    """Apunta el trabajo en la sesión y en la URL (`?trabajos_<tipo>=...`), que sobrevive a recargar."""
+    ids = trabajos_de_sesion(tipo)
+    ids.append(id_trabajo)
+    del ids[:-MAX_TRABAJOS_URL]
+    st.query_params[f"trabajos_{tipo}"] = ids
+
+
+def mostrar_panel_trabajos(tipo):
+    """Lista los trabajos en segundo plano de la sesión y permite consultar cualquiera por ID."""
+    cola = get_cola_trabajos()
+    ids = trabajos_de_sesion(tipo)
+    with st.expander("Trabajos en segundo plano", expanded=bool(ids)):
+        id_consulta = st.text_input("Consultar un trabajo por su ID:", key=f"consulta_{tipo}").strip()
+        st.button("Actualizar estado", key=f"actualizar_{tipo}")
+        # Sin repetir el trabajo consultado si ya está en la lista (sus widgets usan el ID como clave)
+        for id_trabajo in dict.fromkeys(([id_consulta] if id_consulta else []) + ids[::-1]):
+            trabajo = cola.estado(id_trabajo)
+            if trabajo is None or trabajo["tipo"] != tipo:
+                st.warning(f"No existe el trabajo {id_trabajo}")
+                continue
+            st.write(f"**{trabajo['id']}** — {trabajo['estado']}")
+            if trabajo["estado"] == "error":
+                st.error(trabajo["error"])
+            elif trabajo["estado"] == "completado" and tipo == "fabric":
+                mostrar_resultado_fabric(
+                    trabajo["resultado"]["stdout"], trabajo["resultado"]["filename"], key=f"res_{id_trabajo}"
+                )
+            elif trabajo["estado"] == "completado":
+                mostrar_transcripcion(trabajo["resultado"], trabajo["parametros"]["nombre"], key=id_trabajo)
+            st.write("---")
 
 
 # Crear directorio para resultados si no existe
@@ -388,10 +832,13 @@ if not os.path.exists("resultados"):
 # Menú de navegación en la barra lateral
 menu_opcion = st.sidebar.radio(
     "Menú Principal:",
-    ["Fabric", "Trascripción"],
+    ["Fabric", "Trascripción", "Audio → Fabric", "Métricas"],
     index=0
 )
 
+# Se mide en la primera ejecución del proceso; las siguientes reutilizan los módulos
+arranque = get_arranque(menu_opcion)
+
 
 # Mostrar contenido según la opción del menú
 if menu_opcion == "Fabric":
@@ -401,39 +848,57 @@ if menu_opcion == "Fabric":
 
     st.title("Generador de contenido con Fabric AI")
 
+    if arranque["pagina"] == "Fabric":
+        mensaje_arranque = (
+            f"Arranque en frío: importaciones en {arranque['importaciones_ms']:.0f} ms "
+            f"(presupuesto {arranque['presupuesto_ms']} ms)"
+        )
+        if arranque["importaciones_ms"] > arranque["presupuesto_ms"]:
+            st.sidebar.warning(mensaje_arranque)
+        else:
+            st.sidebar.caption(mensaje_arranque)
+
     st.sidebar.title("Opciones")
-    show_files = st.sidebar.button("Mostrar archivos generados")
+    show_files = st.sidebar.checkbox("Mostrar archivos generados")
 
     if show_files:
         st.sidebar.write("Archivos generados:")
-        for filename in os.listdir("resultados"):
-            if filename.endswith(".md"):
-                filepath = os.path.join("resultados", filename)
-                description = get_file_description(filepath)
-                st.sidebar.write(f"**{filename}**")
-                st.sidebar.write(description)
-
-                download_link_md = get_binary_file_downloader_html(filepath, filename)
-                st.sidebar.markdown(download_link_md, unsafe_allow_html=True)
-
-                pdf_filename = filename.replace(".md", ".pdf")
-                pdf_filepath = os.path.join("resultados", pdf_filename)
-                markdown_to_pdf(filepath, pdf_filepath)
-                download_link_pdf = get_binary_file_downloader_html(
-                    pdf_filepath, pdf_filename
-                )
-                st.sidebar.markdown(download_link_pdf, unsafe_allow_html=True)
-
-                # Botón para borrar archivos
-                if st.sidebar.button(f"Borrar {filename}"):
-                    os.remove(filepath)
-                    if os.path.exists(pdf_filepath):
-                        os.remove(pdf_filepath)
-                    st.sidebar.write(f"{filename} y su versión PDF han sido borrados.")
-
-                st.sidebar.write("---")
+        indice_resultados = get_indice_resultados()
+        for entrada in indice_resultados.listar():
+            filename = entrada["filename"]
+            filepath = os.path.join("resultados", filename)
+            st.sidebar.write(f"**{filename}**")
+            if entrada["pattern"]:
+                st.sidebar.caption(f"{entrada['pattern']} · {entrada['model']}")
+            st.sidebar.write(entrada["description"])
+
+            boton_descarga_diferida(filepath, filename, contenedor=st.sidebar)
+
+            pdf_filename = filename.replace(".md", ".pdf")
+            pdf_filepath = os.path.join("resultados", pdf_filename)
+            # Solo se regeneran (en segundo plano) los PDF que faltan o están desactualizados
+            generador_pdfs = get_generador_pdfs()
+            if generador_pdfs.asegurar(filepath, pdf_filepath):
+                boton_descarga_diferida(pdf_filepath, pdf_filename, contenedor=st.sidebar)
+            else:
+                error_pdf = generador_pdfs.error(filepath, pdf_filepath)
+                if error_pdf:
+                    st.sidebar.caption(f"No se pudo generar el PDF: {error_pdf}")
+                else:
+                    st.sidebar.caption("PDF en preparación… vuelve a mostrar la lista en unos segundos.")
+
+            # Botón para borrar archivos
+            if st.sidebar.button(f"Borrar {filename}"):
+                os.remove(filepath)
+                if os.path.exists(pdf_filepath):
+                    os.remove(pdf_filepath)
+                indice_resultados.eliminar(filename)
+                st.sidebar.write(f"{filename} y su versión PDF han sido borrados.")
+
+            st.sidebar.write("---")
 
     input_type = st.radio("Selecciona el tipo de entrada:", ["Texto", "YouTube", "URL"])
+    modo_lote = st.checkbox("Modo lote: aplicar uno o varios patrones a muchas entradas")
 
     # Obtener opciones de Fabric con descripciones
     fabric_options_with_desc = get_fabric_options_with_descriptions()
@@ -445,8 +910,7 @@ if menu_opcion == "Fabric":
     fabric_command = extract_command(selected_option)
 
     # Selección de modelo
-    fabric_models = ("gpt-4o-mini", "gpt-4-0125-preview", "claude-3-5-sonnet-20240620")
-    fabric_modelo = st.radio("Selecciona el Modelo de LLM:", fabric_models)
+    fabric_modelo = st.radio("Selecciona el Modelo de LLM:", FABRIC_MODELOS)
 
     if "] " in fabric_modelo:
         _, model_name = fabric_modelo.split("] ", 1)
@@ -454,8 +918,35 @@ if menu_opcion == "Fabric":
         model_name = fabric_modelo
 
     # Entradas según tipo seleccionado
-    if input_type == "Texto":
+    por_fragmentos = False
+    if modo_lote:
+        patrones_lote = st.multiselect(
+            "Patrones a aplicar en el lote:", fabric_options_with_desc, default=[selected_option]
+        )
+        texto_lote = st.text_area(
+            "Pega las entradas (URLs una por línea, `#` para comentarios; textos separados por una línea con `---`):",
+            height=200,
+        )
+        archivo_lote = st.file_uploader("O sube un archivo .txt con las entradas", type=["txt"])
+        if archivo_lote is not None:
+            separador = "\n---\n" if input_type == "Texto" else "\n"
+            texto_lote += separador + archivo_lote.getvalue().decode("utf-8")
+        concurrencia_lote = st.slider("Ejecuciones de Fabric en paralelo:", 1, 16, 4)
+        entradas_lote = separar_entradas(texto_lote, input_type)
+        st.write(f"{len(entradas_lote)} entradas × {len(patrones_lote)} patrones = {len(entradas_lote) * len(patrones_lote)} trabajos")
+    elif input_type == "Texto":
         prompt = st.text_area("Ingresa tu texto:", "Haz un chiste con manzanas", height=150)
+        por_fragmentos = st.checkbox(
+            "Procesar texto largo por fragmentos en paralelo (map-reduce)", value=contar_tokens(prompt) > 3000
+        )
+        if por_fragmentos:
+            col_a, col_b, col_c = st.columns(3)
+            max_tokens_fragmento = col_a.number_input("Tokens por fragmento", 500, 100000, 3000, step=500)
+            solapamiento_fragmento = col_b.number_input("Solapamiento (tokens)", 0, 5000, 200, step=50)
+            concurrencia_fragmentos = col_c.slider("Fragmentos en paralelo", 1, 16, 4)
+            combinar_con_patron = st.checkbox("Combinar los resultados parciales con el mismo patrón", value=True)
+            num_fragmentos = len(dividir_en_fragmentos(prompt, max_tokens_fragmento, solapamiento_fragmento))
+            st.caption(f"~{contar_tokens(prompt)} tokens → {num_fragmentos} fragmentos (solo en ejecución directa)")
     elif input_type == "YouTube":
         prompt = st.text_input(
             "Ingresa la URL del video de YouTube:",
@@ -470,65 +961,127 @@ if menu_opcion == "Fabric":
     # Añadir instrucción para responder en español
     st.write("📝 La respuesta siempre será en español gracias al parámetro `--language=es`")
 
-    if st.button("Generar contenido"):
-        with st.spinner("Generando contenido con Fabric... esto puede tomar un momento"):
-            if input_type == "Texto":
-                # Aseguramos el prompt para manejar caracteres especiales
-                safe_prompt = shlex.quote(prompt)
-
-                comando = f'echo {safe_prompt} | fabric --pattern {fabric_command} --model {model_name} --language=es'
-
-                # Imprimimos el comando
-                st.code(comando, language="bash")
-
-                # Ejecutamos el comando usando 'bash' para interpretar el pipe
-                resultado = subprocess.run(['bash', '-c', comando], capture_output=True, text=True)
-            elif input_type == "YouTube":
-                comando = (
-                    f"fabric -y '{prompt}' --pattern {fabric_command} --model {model_name} --language=es"
-                )
-
-                st.code(comando, language="bash")
-
-                resultado = subprocess.run(["bash", "-c", comando], capture_output=True, text=True)
-            else:  # URL
-                comando = (
-                    f"fabric -u '{prompt}' --pattern {fabric_command} --model {model_name} --language=es"
+    modo_stream = st.checkbox("Mostrar la respuesta a medida que se genera (--stream)", value=True)
+    ignorar_cache = st.checkbox("Ignorar la caché y volver a ejecutar Fabric", value=False)
+    en_segundo_plano = st.checkbox("Ejecutar en segundo plano (el trabajo continúa aunque recargues la página)")
+    timeout_fabric = st.number_input(
+        "Tiempo máximo por ejecución (segundos, 0 = sin límite)",
+        min_value=0,
+        value=int(FABRIC_TIMEOUT_DEFECTO),
+        step=30,
+        help="Si Fabric no termina en este tiempo se detiene junto con todos sus subprocesos.",
+    )
+
+    cache_respuestas = get_cache_respuestas()
+    with st.sidebar.expander("Caché de respuestas"):
+        stats_respuestas = cache_respuestas.estadisticas()
+        st.write(f"- Entradas: {stats_respuestas['entradas']} / {stats_respuestas['max_entradas']}")
+        st.write(f"- Caducidad: {format_time(stats_respuestas['ttl'])}")
+        st.write(f"- Aciertos: {stats_respuestas['aciertos']} | Fallos: {stats_respuestas['fallos']} ({stats_respuestas['tasa_aciertos']:.0%} aciertos)")
+
+    if modo_lote:
+        if st.button("Procesar lote") and entradas_lote and patrones_lote:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            trabajos = [
+                {
+                    "cache": cache_respuestas,
+                    "indice": get_indice_resultados(),
+                    "input_type": input_type,
+                    "entrada": entrada,
+                    "patron": extract_command(patron),
+                    "modelo": model_name,
+                    "ignorar_cache": ignorar_cache,
+                    "timeout": timeout_fabric,
+                    "filename": f"resultado_{timestamp}_{extract_command(patron)}_{i:03}.md",
+                }
+                for i, (entrada, patron) in enumerate(
+                    (entrada, patron) for entrada in entradas_lote for patron in patrones_lote
                 )
-
-                st.code(comando, language="bash")
-
-                resultado = subprocess.run(["bash", "-c", comando], capture_output=True, text=True)
+            ]
+            estado = [
+                {"Entrada": t["entrada"][:80], "Patrón": t["patron"], "Estado": "En cola"} for t in trabajos
+            ]
+            barra = st.progress(0.0)
+            tabla = st.empty()
+            tabla.table(estado)
+            errores = 0
+            n = 0
+            # Cada medio segundo sin novedades se repinta la barra: así Streamlit puede
+            # detener el script (cualquier clic) y el lote mata los fabric en marcha
+            for i, resultado in ejecutar_lote(procesar_elemento_lote, trabajos, concurrencia_lote, intervalo=0.5):
+                if i is None:
+                    barra.progress(n / len(trabajos), text=f"{n}/{len(trabajos)} completados")
+                    continue
+                n += 1
+                if resultado.returncode == 0:
+                    estado[i]["Estado"] = "✅ " + ("caché" if resultado.desde_cache else trabajos[i]["filename"])
+                else:
+                    errores += 1
+                    estado[i]["Estado"] = "❌ " + resultado.stderr.strip()[:80]
+                barra.progress(n / len(trabajos), text=f"{n}/{len(trabajos)} completados")
+                tabla.table(estado)
+            st.success(f"Lote terminado: {len(trabajos) - errores} correctos, {errores} con error.")
+
+    elif st.button("Generar contenido"):
+        comando = construir_comando(input_type, prompt, fabric_command, model_name, stream=modo_stream)
+
+        # Imprimimos el comando
+        st.code(comando, language="bash")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"resultado_{timestamp}.md"
+
+        if en_segundo_plano:
+            id_trabajo = get_cola_trabajos().encolar("fabric", {
+                "input_type": input_type,
+                "prompt": prompt,
+                "fabric_command": fabric_command,
+                "model_name": model_name,
+                "ignorar_cache": ignorar_cache,
+                "filename": filename,
+                "timeout": timeout_fabric,
+            })
+            recordar_trabajo("fabric", id_trabajo)
+            st.info(f"Trabajo `{id_trabajo}` encolado. Puedes seguir usando la página y consultar su estado abajo.")
+        else:
+            patron_cache = fabric_command
+            if por_fragmentos:
+                patron_cache += f"|fragmentos:{max_tokens_fragmento}:{solapamiento_fragmento}:{combinar_con_patron}"
+            clave_cache = CacheRespuestas.clave(input_type, prompt, patron_cache, model_name)
+            resultado = None if ignorar_cache else cache_respuestas.obtener(clave_cache)
+
+            if resultado is not None:
+                st.info("Respuesta recuperada de la caché (sin volver a ejecutar Fabric).")
+            elif por_fragmentos:
+                barra_fragmentos = st.progress(0.0)
+                with st.spinner("Procesando el texto por fragmentos..."):
+                    resultado = procesar_por_fragmentos(
+                        prompt,
+                        fabric_command,
+                        model_name,
+                        max_tokens_fragmento,
+                        solapamiento_fragmento,
+                        concurrencia_fragmentos,
+                        combinar_con_patron,
+                        al_avanzar=lambda hechos, total: barra_fragmentos.progress(
+                            hechos / total, text=f"{hechos}/{total} fragmentos procesados"
+                        ),
+                        timeout=timeout_fabric,
+                    )
+                cache_respuestas.guardar(clave_cache, resultado)
+            else:
+                with st.spinner("Generando contenido con Fabric... esto puede tomar un momento"):
+                    resultado = ejecutar_fabric_en_vivo(comando, timeout_fabric)
+                cache_respuestas.guardar(clave_cache, resultado)
 
             if resultado.returncode != 0:
                 st.error(f"Error al ejecutar el comando:\n{resultado.stderr}")
             else:
                 st.success("¡Contenido generado con éxito!")
+                guardar_resultado(resultado.stdout, filename, get_indice_resultados(), fabric_command, model_name)
+                mostrar_resultado_fabric(resultado.stdout, filename)
 
-                st.subheader("Resultado:")
-                st.text_area("", value=resultado.stdout, height=300)
-
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"resultado_{timestamp}.md"
-                filepath = os.path.join("resultados", filename)
-
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(resultado.stdout)
-
-                pdf_filename = filename.replace(".md", ".pdf")
-                pdf_filepath = os.path.join("resultados", pdf_filename)
-                markdown_to_pdf(filepath, pdf_filepath)
-
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown(
-                        get_binary_file_downloader_html(filepath, filename), unsafe_allow_html=True
-                    )
-                with col2:
-                    st.markdown(
-                        get_binary_file_downloader_html(pdf_filepath, pdf_filename),
-                        unsafe_allow_html=True,
-                    )
+    mostrar_panel_trabajos("fabric")
 
     # Información adicional en el pie de página
     st.markdown("---")
@@ -539,16 +1092,124 @@ if menu_opcion == "Trascripción":
 
     st.write("Sube un archivo de audio o video (mp3, wav, mp4, etc.) y descarga la transcripción en texto.")
 
+    with st.sidebar.expander("Modelos Whisper en memoria"):
+        stats_modelos = get_registro_modelos().estadisticas()
+        st.write(f"- Aciertos: {stats_modelos['aciertos']} | Fallos: {stats_modelos['fallos']} ({stats_modelos['tasa_aciertos']:.0%} aciertos)")
+        st.write(f"- Tiempo total de carga: {format_time(stats_modelos['tiempo_carga_total'])}")
+        st.write(f"- Memoria: {stats_modelos['memoria_mb']:.0f} / {stats_modelos['presupuesto_mb']} MB | Expulsiones: {stats_modelos['expulsiones']}")
+        for m in stats_modelos["modelos"]:
+            st.write(f"- `{m['nombre']}` ({m['dispositivo']}, {m['motor']}): {m['mb']:.0f} MB, cargado en {m['tiempo_carga']:.2f} s")
+
+    with st.sidebar.expander("Pool de procesos"):
+        stats_pool = get_pool_paralelo().estadisticas()
+        if stats_pool is None:
+            st.write("Sin pool en marcha (se crea al transcribir con más de 1 proceso).")
+        else:
+            st.write(f"- `{stats_pool['modelo']}` ({stats_pool['motor']}) en {stats_pool['procesos']} procesos")
+            st.write(f"- Memoria estimada: {stats_pool['memoria_mb']:.0f} / {stats_pool['presupuesto_mb']} MB")
+
+    with st.sidebar.expander("Planificador de inferencia"):
+        stats_planificador = get_planificador().estadisticas()
+        st.write(f"- Trabajos activos: {stats_planificador['trabajos_activos']}")
+        st.write(f"- Trozos en cola o en curso: {stats_planificador['en_vuelo']} / {stats_planificador['max_en_vuelo']}")
+        st.write(f"- Lotes: {stats_planificador['lotes']} ({stats_planificador['trozos']} trozos)")
+        st.write(f"- Tamaño medio de lote: {stats_planificador['tamano_medio_lote']:.1f} / {stats_planificador['tamano_lote']}")
+        st.write(f"- Tiempo medio por lote: {format_time(stats_planificador['segundos_por_lote'])}")
+
+    with st.sidebar.expander("Caché de transcripciones"):
+        stats_cache = get_cache_transcripciones().estadisticas()
+        st.write(f"- Entradas: {stats_cache['entradas']} en `{stats_cache['directorio']}`")
+        st.write(f"- Ocupado: {format_size(stats_cache['bytes'])}")
+        st.write(f"- Límite: {format_size(stats_cache['max_bytes'])}")
+        st.write(f"- Aciertos: {stats_cache['aciertos']} | Fallos: {stats_cache['fallos']} ({stats_cache['tasa_aciertos']:.0%} aciertos)")
+
     archivo = st.file_uploader("Selecciona tu archivo", type=["mp3", "wav", "mp4", "m4a", "ogg", "flac"])
+    limpiar_subidas_al_arrancar()
+    if archivo is None:
+        obtener_subida(None)
+
+    procesos = st.slider(
+        "Procesos de CPU para transcribir (más de 1 corta el audio en silencios y lo reparte entre procesos):",
+        1, max(2, os.cpu_count() or 1), 1,
+    )
+
+    motor = st.radio(
+        "Motor de inferencia:",
+        list(MOTORES),
+        format_func=lambda m: DESCRIPCIONES_MOTORES.get(m, m),
+        horizontal=True,
+    )
+    procesos_permitidos = get_pool_paralelo().procesos_permitidos("base", procesos, motor)
+    if procesos_permitidos < procesos:
+        st.caption(
+            f"Se usarán {procesos_permitidos} procesos: cada uno carga su propia copia del modelo "
+            "y más no caben en el presupuesto de memoria (WHISPER_PRESUPUESTO_MB)."
+        )
 
-    if archivo is not None:
+    en_segundo_plano = st.checkbox("Transcribir en segundo plano (el trabajo continúa aunque recargues la página)")
+
+    parcial = st.session_state.get("transcripcion_parcial")
+    if parcial and parcial["segments"]:
+        # Transcripción detenida por el usuario: se ofrece lo ya decodificado
+        st.warning(f"Transcripción de {parcial['nombre']} interrumpida; se muestra la parte ya procesada.")
+        mostrar_transcripcion(
+            {"text": "".join(s["text"] for s in parcial["segments"]), "segments": parcial["segments"]},
+            parcial["nombre"],
+            key="parcial",
+        )
+        st.button(
+            "Descartar la transcripción parcial",
+            on_click=lambda: st.session_state.pop("transcripcion_parcial", None),
+        )
+
+    sonda = sondear_subida(archivo) if archivo is not None else None
+    if sonda is not None:
+        st.caption(
+            f"Duración: {format_time(sonda['duracion'])} · {sonda['codec']} ({sonda['contenedor']}) · "
+            f"{sonda['sample_rate']} Hz · {sonda['canales']} canal(es) · leído en {sonda['tiempo_sonda'] * 1000:.0f} ms"
+        )
+    elif archivo is not None:
+        st.caption("No se pudieron leer los metadatos del archivo.")
+
+    disposicion = None
+    if archivo is not None and not en_segundo_plano:
+        with st.expander("Formato de los subtítulos"):
+            originales = st.checkbox("Usar los segmentos originales de Whisper")
+            col_a, col_b, col_c = st.columns(3)
+            disposicion = None if originales else {
+                "max_caracteres": col_a.slider("Caracteres por línea", 20, 80, 42),
+                "max_lineas": col_b.slider("Líneas por subtítulo", 1, 3, 2),
+                "max_duracion": col_c.slider("Duración máxima (s)", 1.0, 10.0, 7.0, step=0.5),
+                "cortar_en_frase": st.checkbox("Cerrar el subtítulo al final de cada frase", value=True),
+            }
+            # La vista previa usa la transcripción ya hecha: cambiar el formato no vuelve a transcribir
+            transcripcion = transcripcion_guardada(archivo, motor=motor)
+            if transcripcion is None:
+                st.caption("La vista previa aparece cuando el archivo ya está transcrito.")
+            else:
+                segmentos = transcripcion["segments"]
+                if disposicion:
+                    segmentos = resegmentar(segmentos, **disposicion)
+                st.code(a_texto(islice(segmentos, 8), "srt"), language=None)
+                if not any(s.get("words") for s in transcripcion["segments"]):
+                    st.caption(
+                        "Esta transcripción no tiene marcas de tiempo por palabra: "
+                        "los tiempos se reparten según la longitud de cada palabra."
+                    )
+
+    if archivo is not None and en_segundo_plano:
+        if st.button("Encolar transcripción"):
+            with st.spinner("Extrayendo el audio..."):
+                id_trabajo = encolar_transcripcion(archivo, motor=motor)
+            recordar_trabajo("transcripcion", id_trabajo)
+            st.info(f"Trabajo `{id_trabajo}` encolado. Puedes consultar su estado abajo.")
+    elif archivo is not None:
         col1, col2, col3 = st.columns(3)
         with col1:
             if st.button("Transcribir"):
                 import time
                 start_time = time.time()
-                with st.spinner("Transcribiendo, esto puede tardar unos minutos..."):
-                    texto = transcribir_archivo(archivo)
+                texto = transcribir_archivo(archivo, procesos=procesos, motor=motor)
                 elapsed = time.time() - start_time
                 st.success("¡Transcripción completada!")
                 st.text_area("Transcripción", texto, height=300)
@@ -562,89 +1223,228 @@ if menu_opcion == "Trascripción":
                 st.markdown("**Estadísticas de transcripción:**")
                 st.write(f"- Tiempo de procesamiento: {format_time(elapsed)}")
                 st.write(f"- Peso del archivo de entrada: {format_size(archivo.size)}")
+                st.write(f"- Volcado a disco de la subida: {format_time(obtener_subida(archivo).tiempo_volcado)}")
+                st.write(f"- Memoria máxima del proceso: {format_size(metricas.memoria_pico() or 0)}")
+                mostrar_medicion(st.session_state.get("medicion_transcripcion"))
                 st.write(f"- Tamaño del archivo de salida: {format_size(len(texto.encode('utf-8')))}")
                 st.write(f"- Cantidad de líneas: {len(texto.splitlines())}")
-                # Duración del audio/video
-                try:
-                    import whisper
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(archivo.name)[1]) as temp:
-                        temp.write(archivo.getvalue())
-                        temp_path = temp.name
-                    model = whisper.load_model("base")
-                    result = model.transcribe(temp_path, language="es")
-                    st.write(f"- Duración del audio/video: {format_time(result['duration'])}")
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+                # Duración del audio/video (de las cabeceras, sin decodificar)
+                if sonda is not None:
+                    st.write(f"- Duración del audio/video: {format_time(sonda['duracion'])}")
 
         with col2:
             if st.button("Generar subtítulos SRT"):
                 import time
                 start_time = time.time()
-                with st.spinner("Generando subtítulos, esto puede tardar unos minutos..."):
-                    srt_content = generar_srt(archivo)
+                srt_path = generar_srt(archivo, procesos=procesos, motor=motor, disposicion=disposicion)
                 elapsed = time.time() - start_time
                 st.success("¡Subtítulos SRT generados!")
-                st.download_button(
-                    label="Descargar subtítulos SRT",
-                    data=srt_content,
-                    file_name=f"{os.path.splitext(archivo.name)[0]}.srt",
-                    mime="text/plain"
-                )
+                # Se escriben a disco en streaming; al servirlos, Streamlit lee el archivo entero
+                with open(srt_path, "rb") as f:
+                    st.download_button(
+                        label="Descargar subtítulos SRT",
+                        data=f,
+                        file_name=f"{os.path.splitext(archivo.name)[0]}.srt",
+                        mime="text/plain"
+                    )
+                with open(exportar_subtitulos(archivo, "vtt", procesos=procesos, motor=motor, disposicion=disposicion), "rb") as f:
+                    st.download_button(
+                        label="Descargar subtítulos VTT",
+                        data=f,
+                        file_name=f"{os.path.splitext(archivo.name)[0]}.vtt",
+                        mime="text/vtt"
+                    )
                 # Estadísticas
                 st.markdown("**Estadísticas de subtítulos SRT:**")
                 st.write(f"- Tiempo de procesamiento: {format_time(elapsed)}")
                 st.write(f"- Peso del archivo de entrada: {format_size(archivo.size)}")
-                st.write(f"- Tamaño del archivo de salida: {format_size(len(srt_content.encode('utf-8')))}")
-                st.write(f"- Cantidad de líneas: {len(srt_content.splitlines())}")
-                # Duración del audio/video
-                try:
-                    import whisper
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(archivo.name)[1]) as temp:
-                        temp.write(archivo.getvalue())
-                        temp_path = temp.name
-                    model = whisper.load_model("base")
-                    result = model.transcribe(temp_path, language="es")
-                    st.write(f"- Duración del audio/video: {format_time(result['duration'])}")
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+                st.write(f"- Volcado a disco de la subida: {format_time(obtener_subida(archivo).tiempo_volcado)}")
+                st.write(f"- Memoria máxima del proceso: {format_size(metricas.memoria_pico() or 0)}")
+                mostrar_medicion(st.session_state.get("medicion_transcripcion"))
+                st.write(f"- Tamaño del archivo de salida: {format_size(os.path.getsize(srt_path))}")
+                st.write(f"- Cantidad de líneas: {contar_lineas(srt_path)}")
+                # Duración del audio/video (de las cabeceras, sin decodificar)
+                if sonda is not None:
+                    st.write(f"- Duración del audio/video: {format_time(sonda['duracion'])}")
 
         with col3:
             if st.button("Generar subtítulos TXT"):
                 import time
                 start_time = time.time()
-                with st.spinner("Generando subtítulos TXT, esto puede tardar unos minutos..."):
-                    txt_content = generar_subtitulos_txt(archivo)
+                txt_path = generar_subtitulos_txt(archivo, procesos=procesos, motor=motor, disposicion=disposicion)
                 elapsed = time.time() - start_time
                 st.success("¡Subtítulos TXT generados!")
-                st.download_button(
-                    label="Descargar subtítulos TXT",
-                    data=txt_content,
-                    file_name=f"{os.path.splitext(archivo.name)[0]}_subtitulos.txt",
-                    mime="text/plain"
-                )
+                with open(txt_path, "rb") as f:
+                    st.download_button(
+                        label="Descargar subtítulos TXT",
+                        data=f,
+                        file_name=f"{os.path.splitext(archivo.name)[0]}_subtitulos.txt",
+                        mime="text/plain"
+                    )
                 # Estadísticas
                 st.markdown("**Estadísticas de subtítulos TXT:**")
                 st.write(f"- Tiempo de procesamiento: {format_time(elapsed)}")
                 st.write(f"- Peso del archivo de entrada: {format_size(archivo.size)}")
-                st.write(f"- Tamaño del archivo de salida: {format_size(len(txt_content.encode('utf-8')))}")
-                st.write(f"- Cantidad de líneas: {len(txt_content.splitlines())}")
-                # Duración del audio/video
-                try:
-                    import whisper
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(archivo.name)[1]) as temp:
-                        temp.write(archivo.getvalue())
-                        temp_path = temp.name
-                    model = whisper.load_model("base")
-                    result = model.transcribe(temp_path, language="es")
-                    st.write(f"- Duración del audio/video: {format_time(result['duration'])}")
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+                st.write(f"- Volcado a disco de la subida: {format_time(obtener_subida(archivo).tiempo_volcado)}")
+                st.write(f"- Memoria máxima del proceso: {format_size(metricas.memoria_pico() or 0)}")
+                mostrar_medicion(st.session_state.get("medicion_transcripcion"))
+                st.write(f"- Tamaño del archivo de salida: {format_size(os.path.getsize(txt_path))}")
+                st.write(f"- Cantidad de líneas: {contar_lineas(txt_path)}")
+                # Duración del audio/video (de las cabeceras, sin decodificar)
+                if sonda is not None:
+                    st.write(f"- Duración del audio/video: {format_time(sonda['duracion'])}")
+
+    mostrar_panel_trabajos("transcripcion")
+
+# Mostrar contenido del pipeline de audio a Fabric
+if menu_opcion == "Audio → Fabric":
+    st.title("De audio a Fabric sin copiar y pegar")
+
+    st.write(
+        "Sube un audio o video: la transcripción pasa directamente al patrón de Fabric, "
+        "que empieza a procesar los primeros fragmentos mientras el resto del audio se sigue transcribiendo."
+    )
+
+    archivo = st.file_uploader(
+        "Selecciona tu archivo", type=["mp3", "wav", "mp4", "m4a", "ogg", "flac"], key="archivo_pipeline"
+    )
+    limpiar_subidas_al_arrancar()
+    if archivo is None:
+        obtener_subida(None, "pipeline")
+    selected_option = st.selectbox(
+        "Selecciona el comando de Fabric:", get_fabric_options_with_descriptions(), key="patron_pipeline"
+    )
+    fabric_command = extract_command(selected_option)
+    model_name = st.radio("Selecciona el Modelo de LLM:", FABRIC_MODELOS, key="modelo_pipeline")
+    col_a, col_b = st.columns(2)
+    max_tokens_pipeline = col_a.number_input("Tokens por fragmento", 500, 100000, 1500, step=500)
+    concurrencia_pipeline = col_b.slider("Fragmentos en paralelo", 1, 16, 4)
+
+    if archivo is not None and st.button("Transcribir y procesar"):
+        # Si la transcripción falla o se detiene el script, los fragmentos en Fabric se cancelan
+        with ProcesadorIncremental(
+            fabric_command, model_name, max_tokens_pipeline, concurrencia_pipeline
+        ) as procesador:
+            subida = obtener_subida(archivo, "pipeline")
+            hash_ = subida.hash
+            cache_transcripciones = get_cache_transcripciones()
+            transcripcion = cache_transcripciones.obtener(hash_, "base", "es")
+            barra = st.progress(0.0)
+
+            if transcripcion is not None:
+                # Transcripción ya conocida: todo el texto va directo a Fabric
+                for segmento in transcripcion["segments"]:
+                    procesador.agregar(segmento["text"])
+                barra.progress(1.0, text="Transcripción recuperada de la caché")
+            else:
+                segmentos = []
+                duracion = 0.0
+                tiempos = {}
+                inicio = time.time()
+                ruta_audio = obtener_audio(archivo, "pipeline")
+                tiempo_extraccion = time.time() - inicio
+                for nuevos, procesados, duracion in get_planificador().transcribir_por_trozos(
+                    ruta_audio, "base", "es", "whisper", tiempos=tiempos, palabras=True
+                ):
+                    segmentos.extend(nuevos)
+                    procesador.agregar(" ".join(s["text"] for s in nuevos))
+                    barra.progress(
+                        procesados / duracion if duracion else 1.0,
+                        text=f"Transcrito {format_time(procesados)} de {format_time(duracion)} · "
+                        f"fragmentos en Fabric: {procesador.enviados()} ({procesador.completados()} listos)",
+                    )
+                transcripcion = {
+                    "text": "".join(s["text"] for s in segmentos),
+                    "language": "es",
+                    "segments": segmentos,
+                    "duration": duracion,
+                    "tiempo_inferencia": time.time() - inicio,
+                    "modelo": "base",
+                    "motor": "whisper",
+                }
+                # Con las palabras, como la página de transcripción: comparten la entrada de la caché
+                cache_transcripciones.guardar(hash_, "base", "es", transcripcion)
+                tiempos["decodificacion_audio"] += tiempo_extraccion
+                registrar_metricas(transcripcion, tiempos, time.time() - inicio, procesos=1, origen="audio_fabric")
+
+            with st.spinner("Esperando a que Fabric termine los últimos fragmentos..."):
+                resultado = procesador.terminar()
+
+        if resultado.returncode != 0:
+            st.error(f"Error al ejecutar el comando:\n{resultado.stderr}")
+        else:
+            st.success(f"¡Contenido generado con éxito en {format_time(resultado.duracion)}!")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"resultado_{timestamp}.md"
+            guardar_resultado(resultado.stdout, filename, get_indice_resultados(), fabric_command, model_name)
+            mostrar_resultado_fabric(resultado.stdout, filename)
+
+        with st.expander("Transcripción utilizada"):
+            mostrar_transcripcion(transcripcion, archivo.name, key="pipeline")
+
+# Panel de métricas de rendimiento acumuladas en `metricas`
+if menu_opcion == "Métricas":
+    st.title("Métricas de rendimiento")
+
+    st.subheader("Transcripción")
+    registros = metricas.leer("transcripcion")
+    if not registros:
+        st.info("Todavía no hay transcripciones registradas.")
+    else:
+        horas_audio = sum(r["duracion_audio"] for r in registros) / 3600
+        st.write(f"{len(registros)} transcripciones · {horas_audio:.2f} h de audio procesadas")
+        resumen = metricas.resumir(
+            registros,
+            ("modelo", "motor", "procesos"),
+            ("factor_tiempo_real", "segmentos_por_segundo", "tiempo_carga_modelo",
+             "tiempo_decodificacion_audio", "tiempo_inferencia", "memoria_pico_proceso"),
+        )
+        st.table([
+            {
+                "Modelo": fila["modelo"],
+                "Motor": fila["motor"],
+                "Procesos": fila["procesos"],
+                "Trabajos": fila["trabajos"],
+                "Tiempo real (media)": f"{fila['factor_tiempo_real_media'] or 0:.2f}x",
+                "Segmentos/s (media)": f"{fila['segmentos_por_segundo_media'] or 0:.2f}",
+                "Carga del modelo (media, s)": f"{fila['tiempo_carga_modelo_media']:.2f}",
+                "Decodificación (media, s)": f"{fila['tiempo_decodificacion_audio_media']:.2f}",
+                "Inferencia (media, s)": f"{fila['tiempo_inferencia_media']:.2f}",
+                "Pico del proceso (máx., MB)": f"{(fila['memoria_pico_proceso_max'] or 0) / 1024 / 1024:.0f}",
+            }
+            for fila in resumen
+        ])
+        st.caption(
+            "El pico del proceso es la memoria máxima del servidor desde que arrancó, no la de cada "
+            "trabajo, y no incluye a los procesos del pool."
+        )
+        with st.expander("Últimas transcripciones"):
+            st.table([
+                {
+                    "Fecha": datetime.fromtimestamp(r["timestamp"]).strftime("%Y-%m-%d %H:%M:%S"),
+                    "Origen": r.get("origen"),
+                    "Modelo": r["modelo"],
+                    "Motor": r.get("motor", "whisper"),
+                    "Audio (s)": f"{r['duracion_audio']:.1f}",
+                    "Total (s)": f"{r['tiempo_total']:.1f}",
+                    "Tiempo real": f"{r['factor_tiempo_real'] or 0:.2f}x",
+                    "Segmentos": r["segmentos"],
+                }
+                for r in reversed(registros[-20:])
+            ])
+
+    st.subheader("Fabric")
+    registros = metricas.leer("fabric")
+    if not registros:
+        st.info("Todavía no hay ejecuciones de Fabric registradas.")
+    else:
+        fila = metricas.resumir(registros, (), ("tiempo_primer_token", "duracion", "bytes_salida"))[0]
+        errores = sum(1 for r in registros if r["returncode"] != 0)
+        detenidas = sum(1 for r in registros if r.get("terminado_por"))
+        st.write(f"- Ejecuciones: {fila['trabajos']} ({errores} con error, {detenidas} detenidas por tiempo o cancelación)")
+        st.write(f"- Tiempo hasta el primer token (media): {format_time(fila['tiempo_primer_token_media'] or 0)}")
+        st.write(f"- Duración (media): {format_time(fila['duracion_media'])}")
+        st.write(f"- Salida (media): {format_size(fila['bytes_salida_media'])}")
 
 # Información adicional en el pie de página
 st.markdown("---")
@@ -0,0 +1,109 @@
+import json
+import os
+import re
+import threading
+
+from archivos import escritura_atomica
+
+
+# Archivo donde se persiste el índice de metadatos de `resultados`
+INDICE_DEFECTO = os.environ.get("INDICE_RESULTADOS", os.path.join("cache", "indice_resultados.json"))
+
+
+def get_file_description(filepath):
+    with open(filepath, "r", encoding="utf-8") as f:
+        content = f.read()
+    match = re.search(r"# RESUMEN\s*(.*?)\s*# IDEAS", content, re.DOTALL)
+    if match:
+        return match.group(1).strip()
+    return "No se encontró descripción"
+
+
+class IndiceResultados:
+    """Índice persistente de los .md generados en `resultados`.
+
+    Guarda nombre, fecha de modificación, tamaño, descripción, patrón y modelo
+    de cada archivo. Se actualiza al escribir o borrar resultados y solo vuelve
+    a recorrer el directorio cuando su fecha de modificación no coincide con la
+    registrada (p. ej. si alguien copió archivos a mano).
+    """
+
+    def __init__(self, directorio="resultados", ruta_indice=None):
+        self.directorio = directorio
+        self.ruta_indice = ruta_indice or INDICE_DEFECTO
+        self._bloqueo = threading.Lock()
+        self._mtime_directorio = None
+        self._entradas = {}
+        try:
+            with open(self.ruta_indice, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            if datos.get("directorio") == os.path.abspath(self.directorio):
+                self._mtime_directorio = datos["mtime_directorio"]
+                self._entradas = datos["entradas"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _guardar(self):
+        os.makedirs(os.path.dirname(self.ruta_indice) or ".", exist_ok=True)
+        with escritura_atomica(self.ruta_indice) as temporal, open(temporal, "w", encoding="utf-8") as f:
+            json.dump({
+                "directorio": os.path.abspath(self.directorio),
+                "mtime_directorio": self._mtime_directorio,
+                "entradas": self._entradas,
+            }, f, ensure_ascii=False)
+
+    def _entrada(self, filename, anterior=None):
+        filepath = os.path.join(self.directorio, filename)
+        stat = os.stat(filepath)
+        anterior = anterior or {}
+        return {
+            "filename": filename,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "description": get_file_description(filepath),
+            "pattern": anterior.get("pattern"),
+            "model": anterior.get("model"),
+        }
+
+    def registrar(self, filename, patron=None, modelo=None):
+        """Añade o actualiza un resultado recién escrito."""
+        with self._bloqueo:
+            entrada = self._entrada(filename, {"pattern": patron, "model": modelo})
+            self._entradas[filename] = entrada
+            self._mtime_directorio = os.path.getmtime(self.directorio)
+            self._guardar()
+
+    def eliminar(self, filename):
+        """Quita un resultado borrado del índice."""
+        with self._bloqueo:
+            self._entradas.pop(filename, None)
+            self._mtime_directorio = os.path.getmtime(self.directorio)
+            self._guardar()
+
+    def sincronizar(self):
+        """Reconcilia el índice con el directorio solo si este cambió por fuera."""
+        with self._bloqueo:
+            mtime = os.path.getmtime(self.directorio)
+            if mtime == self._mtime_directorio:
+                return False
+            presentes = {f for f in os.listdir(self.directorio) if f.endswith(".md")}
+            for filename in set(self._entradas) - presentes:
+                del self._entradas[filename]
+            for filename in presentes:
+                anterior = self._entradas.get(filename)
+                try:
+                    if anterior is None or anterior["mtime"] != os.path.getmtime(
+                        os.path.join(self.directorio, filename)
+                    ):
+                        self._entradas[filename] = self._entrada(filename, anterior)
+                except FileNotFoundError:
+                    self._entradas.pop(filename, None)
+            self._mtime_directorio = mtime
+            self._guardar()
+            return True
+
+    def listar(self):
+        """Entradas del índice, de la más reciente a la más antigua."""
+        self.sincronizar()
+        with self._bloqueo:
+            return sorted(self._entradas.values(), key=lambda e: e["mtime"], reverse=True)
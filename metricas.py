@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+import threading
+import time
+
+
+# Directorio donde se acumulan los registros de métricas (un JSONL por tipo)
+METRICAS_DIR = os.environ.get("METRICAS_DIR", "metricas")
+
+_bloqueo = threading.Lock()
+
+
+def registrar(tipo, datos):
+    """Añade una línea JSON con marca de tiempo al registro de métricas del tipo dado."""
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+    linea = json.dumps({"timestamp": time.time(), **datos}, ensure_ascii=False)
+    with _bloqueo:
+        with open(os.path.join(METRICAS_DIR, f"{tipo}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(linea + "\n")
+
+
+def leer(tipo, limite=None):
+    """Devuelve los registros de un tipo, opcionalmente solo los últimos `limite`."""
+    ruta = os.path.join(METRICAS_DIR, f"{tipo}.jsonl")
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, "r", encoding="utf-8") as f:
+        registros = [json.loads(linea) for linea in f if linea.strip()]
+    return registros[-limite:] if limite else registros
+
+
+def memoria_pico():
+    """Pico de memoria residente del proceso en bytes (None si no se puede medir).
+
+    Es el máximo de toda la vida del proceso, no el de un trabajo concreto, y
+    no incluye a los procesos hijos que siguen vivos (p. ej. los del pool).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return pico if sys.platform == "darwin" else pico * 1024
+
+
+def resumir(registros, agrupar_por, campos):
+    """Agrupa registros por las claves dadas y calcula la media y el máximo de cada campo.
+
+    Los valores ausentes o None no cuentan para la media de su campo.
+    """
+    grupos = {}
+    for registro in registros:
+        clave = tuple(registro.get(c) for c in agrupar_por)
+        grupos.setdefault(clave, []).append(registro)
+    resumen = []
+    for clave, grupo in sorted(grupos.items(), key=lambda g: str(g[0])):
+        fila = dict(zip(agrupar_por, clave))
+        fila["trabajos"] = len(grupo)
+        for campo in campos:
+            valores = [r[campo] for r in grupo if r.get(campo) is not None]
+            fila[f"{campo}_media"] = sum(valores) / len(valores) if valores else None
+            fila[f"{campo}_max"] = max(valores) if valores else None
+        resumen.append(fila)
+    return resumen
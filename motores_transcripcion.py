@@ -0,0 +1,205 @@
+import os
+
+from preprocesado import SAMPLE_RATE
+
+
+# Parámetros (en millones) de cada tamaño, para estimar la memoria de un modelo sin cargarlo
+PARAMETROS_M = {"tiny": 39, "base": 74, "small": 244, "medium": 769, "large": 1550}
+# Segundos que representa cada token de marca de tiempo de Whisper
+SEGUNDOS_POR_MARCA = 0.02
+# Temperaturas y umbrales por defecto de `whisper.transcribe`
+TEMPERATURAS = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+UMBRAL_COMPRESION = 2.4
+UMBRAL_LOGPROB = -1.0
+UMBRAL_SIN_VOZ = 0.6
+
+
+def necesita_repetir(decodificado):
+    """Igual que `transcribe`: repetir si el texto se repite o es improbable, salvo en silencio."""
+    if decodificado.no_speech_prob > UMBRAL_SIN_VOZ:
+        return False
+    return decodificado.compression_ratio > UMBRAL_COMPRESION or decodificado.avg_logprob < UMBRAL_LOGPROB
+
+
+def es_silencio(decodificado):
+    """Igual que `transcribe`: sin voz probable y sin texto que lo desmienta."""
+    return decodificado.no_speech_prob > UMBRAL_SIN_VOZ and decodificado.avg_logprob <= UMBRAL_LOGPROB
+
+
+def segmentos_de_tokens(tokens, tokenizer, duracion):
+    """Reconstruye los segmentos a partir de los tokens de texto y de marca de tiempo.
+
+    Whisper emite <|inicio|> texto <|fin|>; el texto final sin marca de cierre
+    se extiende hasta el final del trozo. Cada segmento conserva sus tokens de
+    texto en "tokens" para poder alinear después las palabras.
+    """
+    segmentos = []
+    inicio = 0.0
+    texto = []
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            marca = (token - tokenizer.timestamp_begin) * SEGUNDOS_POR_MARCA
+            if texto:
+                segmentos.append({"start": inicio, "end": marca, "text": tokenizer.decode(texto), "tokens": texto})
+                texto = []
+            inicio = marca
+        else:
+            texto.append(token)
+    if texto:
+        segmentos.append({"start": inicio, "end": duracion, "text": tokenizer.decode(texto), "tokens": texto})
+    return segmentos
+
+
+class MotorWhisper:
+    """Inferencia con openai-whisper (PyTorch, fp32 en CPU)."""
+
+    nombre = "whisper"
+    bytes_por_parametro = 4
+
+    def cargar(self, modelo, dispositivo, hilos=None):
+        import torch
+        import whisper
+
+        if hilos:
+            torch.set_num_threads(hilos)
+        return whisper.load_model(modelo, device=dispositivo)
+
+    def tamano_mb(self, model):
+        from whisper_modelos import tamano_modelo_mb
+
+        return tamano_modelo_mb(model)
+
+    def transcribir_lote(self, model, trozos, idioma, palabras=False):
+        """Decodifica trozos de hasta 30 s en una sola pasada por lotes del modelo.
+
+        Devuelve, para cada trozo, sus segmentos con tiempos relativos al trozo.
+        Igual que `transcribe`, los trozos con texto repetitivo o improbable se
+        vuelven a decodificar (otra vez por lotes) a temperaturas crecientes y
+        se descartan los que el modelo considera silencio. Los trozos de un
+        lote se decodifican a la vez, así que no llevan el texto anterior como
+        contexto. Con `palabras`, cada trozo se alinea después por separado con
+        las cabezas de atención del modelo para obtener las marcas por palabra.
+        """
+        import torch
+        import whisper
+        from whisper.audio import HOP_LENGTH
+        from whisper.timing import add_word_timestamps
+
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(trozo), model.dims.n_mels) for trozo in trozos
+        ]).to(model.device)
+        decodificados = [None] * len(trozos)
+        pendientes = list(range(len(trozos)))
+        for temperatura in TEMPERATURAS:
+            opciones = whisper.DecodingOptions(
+                language=idioma, temperature=temperatura, fp16=model.device.type == "cuda"
+            )
+            for i, decodificado in zip(pendientes, whisper.decode(model, mel[pendientes], opciones)):
+                decodificados[i] = decodificado
+            pendientes = [i for i in pendientes if necesita_repetir(decodificados[i])]
+            if not pendientes:
+                break
+        tokenizer = whisper.tokenizer.get_tokenizer(
+            model.is_multilingual, num_languages=model.num_languages, language=idioma, task="transcribe"
+        )
+        resultados = []
+        for i, (trozo, decodificado) in enumerate(zip(trozos, decodificados)):
+            if es_silencio(decodificado):
+                resultados.append([])
+                continue
+            segmentos = segmentos_de_tokens(decodificado.tokens, tokenizer, len(trozo) / SAMPLE_RATE)
+            if palabras and segmentos:
+                for segmento in segmentos:
+                    segmento["seek"] = 0
+                add_word_timestamps(
+                    segments=segmentos,
+                    model=model,
+                    tokenizer=tokenizer,
+                    mel=mel[i],
+                    num_frames=len(trozo) // HOP_LENGTH,
+                    last_speech_timestamp=0.0,
+                )
+            resultados.append([
+                {"start": s["start"], "end": s["end"], "text": s["text"], "words": s.get("words")}
+                for s in segmentos
+            ])
+        return resultados
+
+
+class ModeloCTranslate2:
+    """Adapta faster-whisper a la interfaz `transcribe` de openai-whisper.
+
+    Devuelve el mismo diccionario (text, language, segments con start, end y
+    text), de modo que el resto de la aplicación no distingue el motor.
+    """
+
+    def __init__(self, modelo, nombre):
+        self.modelo = modelo
+        self.nombre = nombre
+
+    def transcribe(self, audio, language=None, initial_prompt=None, **opciones):
+        # beam_size=1 equivale a la decodificación voraz por defecto de openai-whisper
+        opciones.setdefault("beam_size", 1)
+        opciones.pop("fp16", None)
+        segmentos, info = self.modelo.transcribe(
+            audio, language=language, initial_prompt=initial_prompt, **opciones
+        )
+        # Los segmentos llegan como generador: la inferencia ocurre al recorrerlos
+        segmentos = [
+            {
+                "start": s.start,
+                "end": s.end,
+                "text": s.text,
+                "words": [{"start": p.start, "end": p.end, "word": p.word} for p in s.words] if s.words else None,
+            }
+            for s in segmentos
+        ]
+        return {
+            "text": "".join(s["text"] for s in segmentos),
+            "language": info.language,
+            "segments": segmentos,
+        }
+
+
+class MotorCTranslate2:
+    """Inferencia con faster-whisper (CTranslate2) cuantizado a int8."""
+
+    nombre = "faster-whisper"
+    bytes_por_parametro = 1
+
+    def cargar(self, modelo, dispositivo, hilos=None):
+        from faster_whisper import WhisperModel
+
+        modelo_ct2 = WhisperModel(
+            modelo,
+            device=dispositivo,
+            compute_type="int8" if dispositivo == "cpu" else "int8_float16",
+            cpu_threads=hilos or 0,
+        )
+        return ModeloCTranslate2(modelo_ct2, modelo)
+
+    def tamano_mb(self, model):
+        # CTranslate2 no expone sus tensores: se estima un byte por parámetro en int8
+        return estimar_mb(self, model.nombre)
+
+    def transcribir_lote(self, model, trozos, idioma, palabras=False):
+        # faster-whisper no agrupa audios distintos en una pasada: se decodifican en serie
+        return [model.transcribe(trozo, language=idioma, word_timestamps=palabras)["segments"] for trozo in trozos]
+
+
+def estimar_mb(motor, modelo):
+    """MB aproximados de los pesos de `modelo` con ese motor, sin cargarlo."""
+    tamano = modelo.split(".")[0].split("-")[0]
+    return PARAMETROS_M.get(tamano, 0) * 1e6 * motor.bytes_por_parametro / (1024 * 1024)
+
+
+MOTORES = {motor.nombre: motor for motor in (MotorWhisper(), MotorCTranslate2())}
+MOTOR_DEFECTO = os.environ.get("TRANSCRIPCION_MOTOR", "whisper")
+
+
+def obtener_motor(nombre=None):
+    """Devuelve el motor de inferencia registrado con ese nombre."""
+    try:
+        return MOTORES[nombre or MOTOR_DEFECTO]
+    except KeyError:
+        raise ValueError(f"Motor de transcripción desconocido: {nombre}") from None
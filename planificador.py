@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from itertools import count
+
+from motores_transcripcion import obtener_motor
+from preprocesado import SAMPLE_RATE, cargar_audio
+from transcripcion import buscar_cortes_silencio, desplazar_segmento, nuevos_tiempos
+
+
+# Trozos por pasada del modelo y máximo de trozos encolados o en curso entre todas las sesiones
+TAMANO_LOTE_DEFECTO = int(os.environ.get("PLANIFICADOR_TAMANO_LOTE", "8"))
+MAX_EN_VUELO_DEFECTO = int(os.environ.get("PLANIFICADOR_MAX_EN_VUELO", "32"))
+
+# Whisper decodifica ventanas de 30 s: los cortes caen entre 24 y 30 s
+SEGUNDOS_TROZO = 24
+SEGUNDOS_BUSQUEDA = 6
+
+
+class _Peticion:
+    def __init__(self, clave, trozo):
+        self.clave = clave
+        self.trozo = trozo
+        self.futuro = Future()
+
+
+class PlanificadorInferencia:
+    """Planificador compartido que decodifica por lotes los trozos de todas las sesiones.
+
+    Cada transcripción corta su audio en silencios en trozos de menos de 30 s y
+    los encola; un único hilo es el dueño del modelo y agrupa en cada pasada
+    trozos del mismo (modelo, motor, idioma, palabras) tomando uno de cada trabajo por
+    turnos, para que una transcripción larga no deje esperando a las demás.
+    Cada trabajo tiene como mucho `tamano_lote` trozos pendientes y el total
+    está limitado por `max_en_vuelo`.
+    """
+
+    def __init__(self, registro, tamano_lote=None, max_en_vuelo=None):
+        self.registro = registro
+        self.tamano_lote = tamano_lote or TAMANO_LOTE_DEFECTO
+        self.max_en_vuelo = max(self.tamano_lote, max_en_vuelo or MAX_EN_VUELO_DEFECTO)
+        self._colas = OrderedDict()
+        self._en_vuelo = 0
+        self._ids = count()
+        self._condicion = threading.Condition()
+        self.lotes = 0
+        self.trozos = 0
+        self.tiempo_lotes = 0.0
+        self._hilo = threading.Thread(target=self._trabajar, daemon=True)
+        self._hilo.start()
+
+    def _armar_lote(self):
+        """Toma por turnos un trozo de cada trabajo con la misma clave que el primero."""
+        primero = next(id_trabajo for id_trabajo, cola in self._colas.items() if cola)
+        clave = self._colas[primero][0].clave
+        lote = []
+        while len(lote) < self.tamano_lote:
+            anadidos = 0
+            for cola in self._colas.values():
+                if cola and cola[0].clave == clave and len(lote) < self.tamano_lote:
+                    lote.append(cola.popleft())
+                    anadidos += 1
+            if not anadidos:
+                break
+        # El trabajo que abrió este lote pasa al final de la ronda
+        self._colas.move_to_end(primero)
+        return lote
+
+    def _trabajar(self):
+        while True:
+            with self._condicion:
+                while not any(self._colas.values()):
+                    self._condicion.wait()
+                lote = self._armar_lote()
+            for peticion in lote:
+                peticion.futuro.set_running_or_notify_cancel()
+            modelo, motor, idioma, palabras = lote[0].clave
+            inicio = time.time()
+            try:
+                with self.registro.uso(modelo, motor=motor) as model:
+                    resultados = obtener_motor(motor).transcribir_lote(
+                        model, [p.trozo for p in lote], idioma, palabras
+                    )
+            except Exception as e:
+                for peticion in lote:
+                    peticion.futuro.set_exception(e)
+            else:
+                for peticion, segmentos in zip(lote, resultados):
+                    peticion.futuro.set_result(segmentos)
+            with self._condicion:
+                self._en_vuelo -= len(lote)
+                self.lotes += 1
+                self.trozos += len(lote)
+                self.tiempo_lotes += time.time() - inicio
+                self._condicion.notify_all()
+
+    def transcribir_por_trozos(self, ruta, modelo="base", idioma="es", motor=None, tiempos=None, palabras=False):
+        """Genera (segmentos, segundos_procesados, duracion) por trozos, en el orden del audio.
+
+        Los trozos se decodifican sin el texto anterior como contexto, porque
+        pueden ir en la misma pasada. En `tiempos` la inferencia es el tiempo
+        de pared desde el primer trozo encolado, esperas incluidas. Con
+        `palabras` los segmentos traen sus marcas de tiempo por palabra.
+        """
+        tiempos = nuevos_tiempos(tiempos)
+        motor = obtener_motor(motor).nombre
+        marca = time.time()
+        audio = cargar_audio(ruta)
+        tiempos["decodificacion_audio"] = time.time() - marca
+        marca = time.time()
+        self.registro.obtener(modelo, motor=motor)
+        tiempos["carga_modelo"] = time.time() - marca
+
+        duracion = len(audio) / SAMPLE_RATE
+        cortes = buscar_cortes_silencio(audio, SAMPLE_RATE, SEGUNDOS_TROZO, SEGUNDOS_BUSQUEDA)
+        clave = (modelo, motor, idioma, palabras)
+        id_trabajo = next(self._ids)
+        esperando = deque()
+        siguiente = 0
+        marca = time.time()
+        with self._condicion:
+            self._colas[id_trabajo] = deque()
+        try:
+            while siguiente < len(cortes) or esperando:
+                with self._condicion:
+                    while siguiente < len(cortes) and len(esperando) < self.tamano_lote:
+                        if self._en_vuelo >= self.max_en_vuelo:
+                            if esperando:
+                                break
+                            self._condicion.wait()
+                            continue
+                        inicio, fin = cortes[siguiente]
+                        peticion = _Peticion(clave, audio[inicio:fin])
+                        self._colas[id_trabajo].append(peticion)
+                        esperando.append((inicio, fin, peticion.futuro))
+                        self._en_vuelo += 1
+                        siguiente += 1
+                    self._condicion.notify_all()
+                inicio, fin, futuro = esperando.popleft()
+                desplazamiento = inicio / SAMPLE_RATE
+                segmentos = [desplazar_segmento(s, desplazamiento) for s in futuro.result()]
+                tiempos["inferencia"] = time.time() - marca
+                yield segmentos, fin / SAMPLE_RATE, duracion
+        finally:
+            # Si la sesión se detiene, sus trozos aún no decodificados salen de la cola
+            with self._condicion:
+                cola = self._colas.pop(id_trabajo)
+                self._en_vuelo -= len(cola)
+                for peticion in cola:
+                    peticion.futuro.cancel()
+                self._condicion.notify_all()
+
+    def transcribir(self, ruta, modelo="base", idioma="es", motor=None, tiempos=None, palabras=False):
+        """Transcripción completa a través del planificador, con el formato de `transcribir`."""
+        inicio = time.time()
+        segmentos = []
+        duracion = 0.0
+        for nuevos, _, duracion in self.transcribir_por_trozos(ruta, modelo, idioma, motor, tiempos, palabras):
+            segmentos.extend(nuevos)
+        return {
+            "text": "".join(s["text"] for s in segmentos),
+            "language": idioma,
+            "segments": segmentos,
+            "duration": duracion,
+            "tiempo_inferencia": time.time() - inicio,
+            "modelo": modelo,
+            "motor": obtener_motor(motor).nombre,
+        }
+
+    def estadisticas(self):
+        """Lotes ejecutados, tamaño medio de lote y trabajo pendiente."""
+        with self._condicion:
+            return {
+                "lotes": self.lotes,
+                "trozos": self.trozos,
+                "tamano_medio_lote": self.trozos / self.lotes if self.lotes else 0.0,
+                "segundos_por_lote": self.tiempo_lotes / self.lotes if self.lotes else 0.0,
+                "en_vuelo": self._en_vuelo,
+                "max_en_vuelo": self.max_en_vuelo,
+                "tamano_lote": self.tamano_lote,
+                "trabajos_activos": len(self._colas),
+            }
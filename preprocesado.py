@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import subprocess
+import time
+import uuid
+import wave
+
+from archivos import escritura_atomica, expulsar_lru
+
+
+# Caché de pistas de audio ya extraídas a 16 kHz mono, indexada por huella de la subida
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", os.path.join("cache", "audio"))
+AUDIO_CACHE_MB = int(os.environ.get("AUDIO_CACHE_MB", "2048"))
+# "flac" ocupa la mitad; "wav" (PCM 16 bits) se carga sin pasar por ffmpeg
+AUDIO_CACHE_FORMATO = os.environ.get("AUDIO_CACHE_FORMATO", "flac")
+# Pistas reservadas por trabajos en segundo plano, fuera del alcance de la limpieza LRU
+AUDIO_TRABAJOS_DIR = os.environ.get("AUDIO_TRABAJOS_DIR", os.path.join("cache", "audio_trabajos"))
+
+SAMPLE_RATE = 16000
+CODECS = {"flac": "flac", "wav": "pcm_s16le"}
+
+
+def extraer_audio(ruta, hash_, directorio=None, formato=None):
+    """Extrae una sola vez la pista de audio a 16 kHz mono y devuelve su ruta en caché.
+
+    Los vídeos (mp4) solo se demultiplexan y decodifican aquí; después Whisper
+    y las sondas de duración leen este archivo, mucho más pequeño.
+    """
+    directorio = directorio or AUDIO_CACHE_DIR
+    formato = formato or AUDIO_CACHE_FORMATO
+    destino = os.path.join(directorio, f"{hash_}.{formato}")
+    if os.path.exists(destino):
+        os.utime(destino)
+        return destino
+
+    os.makedirs(directorio, exist_ok=True)
+    with escritura_atomica(destino) as temporal:
+        subprocess.run(
+            [
+                "ffmpeg", "-nostdin", "-y", "-i", ruta,
+                "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", CODECS[formato],
+                "-f", formato, temporal,
+            ],
+            capture_output=True,
+            check=True,
+        )
+    limpiar_cache_audio(directorio)
+    return destino
+
+
+def reservar_audio(ruta, directorio=None):
+    """Enlaza (o copia) una pista de la caché a un archivo propio del trabajo.
+
+    La caché de audio puede expulsar la pista antes de que el trabajador llegue
+    a ella; el enlace duro mantiene el contenido sin ocupar disco de más. Quien
+    la reserva la libera con `liberar_audio` al terminar.
+    """
+    directorio = directorio or AUDIO_TRABAJOS_DIR
+    os.makedirs(directorio, exist_ok=True)
+    destino = os.path.join(directorio, f"{uuid.uuid4().hex}{os.path.splitext(ruta)[1]}")
+    try:
+        os.link(ruta, destino)
+    except OSError:
+        shutil.copy2(ruta, destino)
+    return destino
+
+
+def liberar_audio(ruta, directorio=None):
+    """Borra una pista reservada; las rutas de fuera de la reserva no se tocan."""
+    directorio = os.path.abspath(directorio or AUDIO_TRABAJOS_DIR)
+    if os.path.dirname(os.path.abspath(ruta)) != directorio:
+        return
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+def sondear_medio(ruta):
+    """Lee duración, frecuencia de muestreo, canales y códec de las cabeceras del contenedor.
+
+    Usa ffprobe, que no decodifica el audio; si no está disponible y el archivo
+    es WAV, se leen las cabeceras con el módulo `wave`.
+    """
+    inicio = time.time()
+    try:
+        salida = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-select_streams", "a:0",
+                "-show_entries", "format=duration,format_name:stream=codec_name,sample_rate,channels,duration",
+                "-of", "json", ruta,
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        datos = json.loads(salida)
+        pista = (datos.get("streams") or [{}])[0]
+        formato = datos.get("format", {})
+        sonda = {
+            "duracion": float(formato.get("duration") or pista.get("duration") or 0.0),
+            "sample_rate": int(pista.get("sample_rate") or 0),
+            "canales": int(pista.get("channels") or 0),
+            "codec": pista.get("codec_name", "desconocido"),
+            "contenedor": formato.get("format_name", "desconocido"),
+        }
+    except FileNotFoundError:
+        with wave.open(ruta, "rb") as w:
+            sonda = {
+                "duracion": w.getnframes() / w.getframerate(),
+                "sample_rate": w.getframerate(),
+                "canales": w.getnchannels(),
+                "codec": f"pcm_s{8 * w.getsampwidth()}le",
+                "contenedor": "wav",
+            }
+    sonda["tiempo_sonda"] = time.time() - inicio
+    return sonda
+
+
+def cargar_audio(ruta):
+    """Carga el audio como float32 a 16 kHz; los WAV de la caché se leen directamente."""
+    import numpy as np
+
+    if ruta.endswith(".wav"):
+        with wave.open(ruta, "rb") as w:
+            if w.getframerate() == SAMPLE_RATE and w.getnchannels() == 1 and w.getsampwidth() == 2:
+                datos = w.readframes(w.getnframes())
+                return np.frombuffer(datos, np.int16).astype(np.float32) / 32768.0
+
+    import whisper
+
+    return whisper.load_audio(ruta)
+
+
+def limpiar_cache_audio(directorio=None, max_mb=None):
+    """Borra las pistas usadas hace más tiempo mientras la caché supere su límite."""
+    directorio = directorio or AUDIO_CACHE_DIR
+    expulsar_lru(directorio, (max_mb or AUDIO_CACHE_MB) * 1024 * 1024, conservar_ultimo=True)
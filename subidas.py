@@ -0,0 +1,66 @@
+import hashlib
+import os
+import tempfile
+import time
+import weakref
+
+
+# Tamaño de cada bloque al volcar una subida a disco
+TAMANO_BLOQUE = 1024 * 1024
+DIRECTORIO_SUBIDAS = os.environ.get("SUBIDAS_DIR", os.path.join(tempfile.gettempdir(), "fabric-gui-subidas"))
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+class SubidaEnDisco:
+    """Copia en disco de un archivo subido, hecha una sola vez y por bloques.
+
+    El SHA-256 se calcula en la misma pasada, sin juntar nunca el contenido
+    en un bytes de Python. El archivo se borra al llamar a `cerrar()`, cuando
+    el objeto deja de usarse o, en último caso, al terminar el proceso.
+    """
+
+    def __init__(self, archivo, identificador=None):
+        self.identificador = identificador or archivo.name
+        self.nombre = archivo.name
+        os.makedirs(DIRECTORIO_SUBIDAS, exist_ok=True)
+        inicio = time.time()
+        sha = hashlib.sha256()
+        archivo.seek(0)
+        with tempfile.NamedTemporaryFile(
+            delete=False, dir=DIRECTORIO_SUBIDAS, suffix=os.path.splitext(archivo.name)[1]
+        ) as temp:
+            while True:
+                bloque = archivo.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                sha.update(bloque)
+                temp.write(bloque)
+            self.ruta = temp.name
+        archivo.seek(0)
+        self.hash = sha.hexdigest()
+        self.tamano = os.path.getsize(self.ruta)
+        self.tiempo_volcado = time.time() - inicio
+        self._finalizador = weakref.finalize(self, _borrar, self.ruta)
+
+    def cerrar(self):
+        self._finalizador()
+
+
+def limpiar_subidas_huerfanas(antiguedad=24 * 3600):
+    """Borra volcados que quedaron de procesos anteriores que terminaron mal."""
+    if not os.path.isdir(DIRECTORIO_SUBIDAS):
+        return
+    limite = time.time() - antiguedad
+    for nombre in os.listdir(DIRECTORIO_SUBIDAS):
+        ruta = os.path.join(DIRECTORIO_SUBIDAS, nombre)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except FileNotFoundError:
+            pass
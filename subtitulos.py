@@ -0,0 +1,151 @@
+import io
+import os
+
+from archivos import escritura_atomica, expulsar_lru
+
+
+# Subtítulos ya exportados, indexados por transcripción y formato, y su tamaño máximo
+SUBTITULOS_DIR = os.environ.get("SUBTITULOS_DIR", os.path.join("cache", "subtitulos"))
+SUBTITULOS_MB = int(os.environ.get("SUBTITULOS_MB", "200"))
+
+
+def formato_tiempo(segundos, separador=","):
+    """HH:MM:SS,mmm (SRT) o HH:MM:SS.mmm (VTT con separador=".")."""
+    milisegundos = round(segundos * 1000)
+    horas, milisegundos = divmod(milisegundos, 3_600_000)
+    minutos, milisegundos = divmod(milisegundos, 60_000)
+    segundos, milisegundos = divmod(milisegundos, 1000)
+    return f"{horas:02}:{minutos:02}:{segundos:02}{separador}{milisegundos:03}"
+
+
+def escribir_srt(segmentos, destino):
+    """Escribe cada segmento en cuanto llega; devuelve cuántos se escribieron."""
+    n = 0
+    for n, segmento in enumerate(segmentos, 1):
+        inicio = formato_tiempo(segmento["start"])
+        fin = formato_tiempo(segmento["end"])
+        destino.write(f"{n}\n{inicio} --> {fin}\n{segmento['text'].strip()}\n\n")
+    return n
+
+
+def escribir_vtt(segmentos, destino):
+    destino.write("WEBVTT\n\n")
+    n = 0
+    for n, segmento in enumerate(segmentos, 1):
+        inicio = formato_tiempo(segmento["start"], ".")
+        fin = formato_tiempo(segmento["end"], ".")
+        destino.write(f"{inicio} --> {fin}\n{segmento['text'].strip()}\n\n")
+    return n
+
+
+def escribir_txt(segmentos, destino):
+    """Una línea por segmento, sin salto de línea final."""
+    n = 0
+    for n, segmento in enumerate(segmentos, 1):
+        destino.write(("\n" if n > 1 else "") + segmento["text"].strip())
+    return n
+
+
+ESCRITORES = {"srt": escribir_srt, "vtt": escribir_vtt, "txt": escribir_txt}
+
+FIN_DE_FRASE = (".", "?", "!", "…")
+
+
+def palabras_de_segmentos(segmentos):
+    """Genera (inicio, fin, palabra) de cada palabra de los segmentos.
+
+    Los segmentos sin marcas por palabra (p. ej. transcripciones antiguas de
+    la caché) reparten su duración entre sus palabras según su longitud.
+    """
+    for segmento in segmentos:
+        if segmento.get("words"):
+            for palabra in segmento["words"]:
+                texto = palabra["word"].strip()
+                if texto:
+                    yield palabra["start"], palabra["end"], texto
+            continue
+        palabras = segmento["text"].split()
+        caracteres = sum(len(p) for p in palabras)
+        por_caracter = (segmento["end"] - segmento["start"]) / caracteres if caracteres else 0.0
+        inicio = segmento["start"]
+        for palabra in palabras:
+            fin = inicio + len(palabra) * por_caracter
+            yield inicio, fin, palabra
+            inicio = fin
+
+
+def resegmentar(segmentos, max_caracteres=42, max_lineas=2, max_duracion=7.0, cortar_en_frase=True):
+    """Rehace los subtítulos a partir de las palabras en una sola pasada lineal.
+
+    Cada palabra se añade a la línea en curso; si no cabe en `max_caracteres`
+    se abre otra línea y, si ya se usaron `max_lineas` o el subtítulo pasaría
+    de `max_duracion` segundos, se cierra el subtítulo. Con `cortar_en_frase`
+    un final de frase también lo cierra. Genera segmentos con start, end y
+    text (las líneas separadas por saltos de línea), listos para `exportar`.
+    """
+    lineas = []
+    inicio = fin = None
+    for inicio_palabra, fin_palabra, palabra in palabras_de_segmentos(segmentos):
+        if inicio is not None:
+            cabe = len(lineas[-1]) + 1 + len(palabra) <= max_caracteres
+            if (not cabe and len(lineas) >= max_lineas) or fin_palabra - inicio > max_duracion:
+                yield {"start": inicio, "end": fin, "text": "\n".join(lineas)}
+                inicio = None
+            elif cabe:
+                lineas[-1] += " " + palabra
+            else:
+                lineas.append(palabra)
+        if inicio is None:
+            inicio = inicio_palabra
+            lineas = [palabra]
+        fin = fin_palabra
+        if cortar_en_frase and palabra.endswith(FIN_DE_FRASE):
+            yield {"start": inicio, "end": fin, "text": "\n".join(lineas)}
+            inicio = None
+    if inicio is not None:
+        yield {"start": inicio, "end": fin, "text": "\n".join(lineas)}
+
+
+def exportar(segmentos, formato, destino):
+    """Escribe los segmentos de cualquier iterable en un archivo o buffer de texto."""
+    return ESCRITORES[formato](segmentos, destino)
+
+
+def a_texto(segmentos, formato):
+    """Devuelve los subtítulos como cadena, construida en un buffer en tiempo lineal."""
+    buffer = io.StringIO()
+    exportar(segmentos, formato, buffer)
+    return buffer.getvalue()
+
+
+def exportar_a_archivo(segmentos, formato, ruta):
+    """Escribe los subtítulos directamente a disco sin tenerlos enteros en memoria.
+
+    Con un generador de segmentos la memoria no crece con la duración del medio.
+    """
+    with escritura_atomica(ruta) as temporal, open(temporal, "w", encoding="utf-8", newline="\n") as f:
+        n = exportar(segmentos, formato, f)
+    return n
+
+
+def limpiar_subtitulos(directorio=None, max_mb=None):
+    """Borra los subtítulos usados hace más tiempo mientras el directorio supere su límite."""
+    directorio = directorio or SUBTITULOS_DIR
+    expulsar_lru(directorio, (max_mb or SUBTITULOS_MB) * 1024 * 1024, conservar_ultimo=True)
+
+
+def exportar_en_cache(segmentos, clave, formato, directorio=None, max_mb=None):
+    """Ruta de los subtítulos de una transcripción, escritos a disco solo la primera vez.
+
+    Cada disposición de `resegmentar` es un archivo distinto, así que el
+    directorio se limita a `max_mb` expulsando por LRU.
+    """
+    directorio = directorio or SUBTITULOS_DIR
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"{clave}.{formato}")
+    if os.path.exists(ruta):
+        os.utime(ruta)
+        return ruta
+    exportar_a_archivo(segmentos, formato, ruta)
+    limpiar_subtitulos(directorio, max_mb)
+    return ruta
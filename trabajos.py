@@ -0,0 +1,149 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+# Base de datos donde se guarda la tabla de trabajos en segundo plano
+TRABAJOS_DB_DEFECTO = os.environ.get("TRABAJOS_DB", os.path.join("cache", "trabajos.sqlite3"))
+TRABAJADORES_DEFECTO = int(os.environ.get("TRABAJOS_TRABAJADORES", "2"))
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    parametros TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    resultado TEXT,
+    error TEXT,
+    creado REAL NOT NULL,
+    iniciado REAL,
+    terminado REAL
+)
+"""
+
+
+class ColaTrabajos:
+    """Cola local de trabajos persistida en SQLite y atendida por hilos trabajadores.
+
+    La interfaz solo encola y consulta: los trabajos sobreviven a los reruns de
+    Streamlit y a las recargas del navegador porque viven en el proceso del
+    servidor y en la tabla `trabajos`.
+    """
+
+    def __init__(self, ruta_db=None, trabajadores=None):
+        self.ruta_db = ruta_db or TRABAJOS_DB_DEFECTO
+        os.makedirs(os.path.dirname(self.ruta_db) or ".", exist_ok=True)
+        self._manejadores = {}
+        self._hay_trabajo = threading.Condition()
+        with self._conexion() as conexion:
+            conexion.execute(ESQUEMA)
+            # Los trabajos que quedaron a medias en un proceso anterior se reintentan
+            conexion.execute("UPDATE trabajos SET estado = 'pendiente' WHERE estado = 'en_curso'")
+        self._hilos = [
+            threading.Thread(target=self._trabajar, daemon=True)
+            for _ in range(trabajadores or TRABAJADORES_DEFECTO)
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    @contextmanager
+    def _conexion(self):
+        conexion = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+        try:
+            yield conexion
+        finally:
+            conexion.close()
+
+    def registrar_tipo(self, tipo, funcion):
+        """Asocia un tipo de trabajo con la función que lo ejecuta."""
+        self._manejadores[tipo] = funcion
+        with self._hay_trabajo:
+            self._hay_trabajo.notify_all()
+
+    def encolar(self, tipo, parametros):
+        """Da de alta un trabajo y devuelve su identificador."""
+        id_trabajo = uuid.uuid4().hex[:12]
+        with self._conexion() as conexion:
+            conexion.execute(
+                "INSERT INTO trabajos (id, tipo, parametros, estado, creado) VALUES (?, ?, ?, 'pendiente', ?)",
+                (id_trabajo, tipo, json.dumps(parametros, ensure_ascii=False), time.time()),
+            )
+        with self._hay_trabajo:
+            self._hay_trabajo.notify()
+        return id_trabajo
+
+    def _fila_a_dict(self, fila):
+        if fila is None:
+            return None
+        id_trabajo, tipo, parametros, estado, resultado, error, creado, iniciado, terminado = fila
+        return {
+            "id": id_trabajo,
+            "tipo": tipo,
+            "parametros": json.loads(parametros),
+            "estado": estado,
+            "resultado": json.loads(resultado) if resultado else None,
+            "error": error,
+            "creado": creado,
+            "iniciado": iniciado,
+            "terminado": terminado,
+        }
+
+    def estado(self, id_trabajo):
+        """Devuelve el trabajo con su estado y, si terminó, su resultado."""
+        with self._conexion() as conexion:
+            fila = conexion.execute("SELECT * FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+        return self._fila_a_dict(fila)
+
+    def listar(self, limite=20, tipo=None):
+        consulta = "SELECT * FROM trabajos"
+        parametros = ()
+        if tipo:
+            consulta += " WHERE tipo = ?"
+            parametros = (tipo,)
+        consulta += " ORDER BY creado DESC LIMIT ?"
+        with self._conexion() as conexion:
+            filas = conexion.execute(consulta, parametros + (limite,)).fetchall()
+        return [self._fila_a_dict(fila) for fila in filas]
+
+    def _reclamar(self):
+        """Marca como en curso el trabajo pendiente más antiguo de un tipo conocido."""
+        tipos = list(self._manejadores)
+        if not tipos:
+            return None
+        marcas = ", ".join("?" for _ in tipos)
+        with self._conexion() as conexion:
+            conexion.execute("BEGIN IMMEDIATE")
+            fila = conexion.execute(
+                f"SELECT * FROM trabajos WHERE estado = 'pendiente' AND tipo IN ({marcas}) "
+                "ORDER BY creado LIMIT 1",
+                tipos,
+            ).fetchone()
+            if fila is not None:
+                conexion.execute(
+                    "UPDATE trabajos SET estado = 'en_curso', iniciado = ? WHERE id = ?",
+                    (time.time(), fila[0]),
+                )
+            conexion.execute("COMMIT")
+        return self._fila_a_dict(fila)
+
+    def _trabajar(self):
+        while True:
+            trabajo = self._reclamar()
+            if trabajo is None:
+                with self._hay_trabajo:
+                    self._hay_trabajo.wait(timeout=2)
+                continue
+            try:
+                resultado = self._manejadores[trabajo["tipo"]](**trabajo["parametros"])
+                campos = ("completado", json.dumps(resultado, ensure_ascii=False), None)
+            except Exception as e:
+                campos = ("error", None, f"{type(e).__name__}: {e}")
+            with self._conexion() as conexion:
+                conexion.execute(
+                    "UPDATE trabajos SET estado = ?, resultado = ?, error = ?, terminado = ? WHERE id = ?",
+                    campos + (time.time(), trabajo["id"]),
+                )
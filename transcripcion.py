@@ -0,0 +1,350 @@
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metricas
+from archivos import entradas_por_uso, escritura_atomica, expulsar_lru
+from motores_transcripcion import estimar_mb, obtener_motor
+from preprocesado import SAMPLE_RATE, cargar_audio
+
+
+# Directorio y tamaño máximo de la caché persistente de transcripciones
+CACHE_DIR_DEFECTO = os.environ.get("TRANSCRIPCIONES_CACHE_DIR", os.path.join("cache", "transcripciones"))
+CACHE_MB_DEFECTO = int(os.environ.get("TRANSCRIPCIONES_CACHE_MB", "500"))
+
+
+def hash_contenido(datos):
+    """Huella SHA-256 de los bytes subidos, usada como clave de caché."""
+    return hashlib.sha256(datos).hexdigest()
+
+
+def desplazar_segmento(segmento, desplazamiento=0.0):
+    """Copia un segmento con sus tiempos, y los de sus palabras si las trae, desplazados."""
+    nuevo = {
+        "start": segmento["start"] + desplazamiento,
+        "end": segmento["end"] + desplazamiento,
+        "text": segmento["text"],
+    }
+    if segmento.get("words"):
+        nuevo["words"] = [
+            {"start": p["start"] + desplazamiento, "end": p["end"] + desplazamiento, "word": p["word"]}
+            for p in segmento["words"]
+        ]
+    return nuevo
+
+
+def nuevos_tiempos(tiempos):
+    """Inicializa el diccionario donde cada transcripción acumula sus tiempos por fase."""
+    if tiempos is None:
+        tiempos = {}
+    tiempos.update({"carga_modelo": 0.0, "decodificacion_audio": 0.0, "inferencia": 0.0})
+    return tiempos
+
+
+def transcribir(ruta, registro, modelo="base", idioma="es", tiempos=None, motor=None, palabras=False):
+    """Ejecuta una única decodificación y devuelve texto, segmentos y duración.
+
+    `motor` elige el backend de inferencia (ver `motores_transcripcion`); todos
+    devuelven los mismos segmentos. Con `palabras` cada segmento trae además
+    sus palabras con marcas de tiempo en "words". Si se pasa `tiempos`, se
+    rellena con los segundos de carga del modelo, decodificación del audio e
+    inferencia.
+    """
+    motor = obtener_motor(motor).nombre
+    tiempos = nuevos_tiempos(tiempos)
+    inicio = time.time()
+    audio = cargar_audio(ruta)
+    tiempos["decodificacion_audio"] = time.time() - inicio
+    inicio = time.time()
+    registro.obtener(modelo, motor=motor)
+    tiempos["carga_modelo"] = time.time() - inicio
+    inicio = time.time()
+    with registro.uso(modelo, motor=motor) as model:
+        result = model.transcribe(audio, language=idioma, word_timestamps=palabras)
+    tiempos["inferencia"] = time.time() - inicio
+    return {
+        "text": result["text"],
+        "language": result.get("language", idioma),
+        "segments": [desplazar_segmento(s) for s in result.get("segments", [])],
+        "duration": len(audio) / SAMPLE_RATE,
+        "tiempo_inferencia": time.time() - inicio,
+        "modelo": modelo,
+        "motor": motor,
+    }
+
+
+def buscar_cortes_silencio(audio, sample_rate, segundos_trozo=60, segundos_busqueda=10, ms_trama=30):
+    """Divide el audio en trozos de ~segundos_trozo cortando en silencios.
+
+    Calcula la energía RMS por tramas y, alrededor de cada punto de corte
+    nominal, elige la trama más silenciosa (suavizada ~300 ms) para no partir
+    palabras. Devuelve una lista de (inicio, fin) en muestras.
+    """
+    import numpy as np
+
+    trama = int(sample_rate * ms_trama / 1000)
+    n_tramas = len(audio) // trama
+    objetivo = int(segundos_trozo * 1000 / ms_trama)
+    busqueda = int(segundos_busqueda * 1000 / ms_trama)
+    if n_tramas <= objetivo + busqueda:
+        return [(0, len(audio))]
+
+    energia = np.sqrt(np.mean(audio[:n_tramas * trama].reshape(n_tramas, trama) ** 2, axis=1))
+    suavizado = np.ones(10) / 10
+    cortes = [0]
+    posicion = objetivo
+    while posicion < n_tramas - busqueda:
+        inicio = max(cortes[-1] + 1, posicion - busqueda)
+        fin = min(n_tramas, posicion + busqueda)
+        ventana = np.convolve(energia[inicio:fin], suavizado, mode="same")
+        corte = inicio + int(np.argmin(ventana))
+        cortes.append(corte)
+        posicion = corte + objetivo
+
+    limites = [c * trama for c in cortes] + [len(audio)]
+    return list(zip(limites[:-1], limites[1:]))
+
+
+# Modelo propio de cada proceso trabajador del pool de transcripción
+_modelo_proceso = None
+# Segundos de carga del modelo aún no comunicados al proceso principal
+_carga_proceso = 0.0
+
+
+def _iniciar_proceso(modelo, hilos, motor):
+    global _modelo_proceso, _carga_proceso
+    inicio = time.time()
+    _modelo_proceso = obtener_motor(motor).cargar(modelo, "cpu", hilos)
+    _carga_proceso = time.time() - inicio
+
+
+def _transcribir_trozo(args):
+    global _carga_proceso
+    trozo, desplazamiento, idioma, palabras = args
+    result = _modelo_proceso.transcribe(trozo, language=idioma, fp16=False, word_timestamps=palabras)
+    # La carga se informa solo con el primer trozo que atiende cada proceso
+    carga, _carga_proceso = _carga_proceso, 0.0
+    return [desplazar_segmento(s, desplazamiento) for s in result.get("segments", [])], carga
+
+
+class TranscriptorParalelo:
+    """Transcribe en CPU repartiendo trozos cortados en silencios entre procesos.
+
+    Cada proceso carga su propia copia del modelo una sola vez y usa
+    cpu_count / procesos hilos de inferencia; las marcas de tiempo de cada trozo se
+    desplazan a su posición en el audio original antes de unirlas.
+    """
+
+    def __init__(self, modelo="base", procesos=None, motor=None):
+        self.modelo = modelo
+        self.motor = obtener_motor(motor).nombre
+        self.procesos = procesos or max(1, (os.cpu_count() or 2) // 2)
+        hilos = max(1, (os.cpu_count() or 1) // self.procesos)
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.procesos,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_proceso,
+            initargs=(modelo, hilos, self.motor),
+        )
+
+    def transcribir_por_trozos(self, ruta, idioma="es", segundos_trozo=60, tiempos=None, palabras=False):
+        """Genera (segmentos, segundos_procesados, duracion) trozo a trozo y en orden.
+
+        En `tiempos` la carga del modelo suma la de los procesos que lo cargaron
+        durante este trabajo (en paralelo, así que puede solaparse con la
+        inferencia) y la inferencia es el tiempo de pared del reparto.
+        """
+        tiempos = nuevos_tiempos(tiempos)
+        marca = time.time()
+        audio = cargar_audio(ruta)
+        tiempos["decodificacion_audio"] = time.time() - marca
+        sample_rate = SAMPLE_RATE
+        duracion = len(audio) / sample_rate
+        cortes = buscar_cortes_silencio(audio, sample_rate, segundos_trozo)
+        trabajos = [(audio[inicio:fin], inicio / sample_rate, idioma, palabras) for inicio, fin in cortes]
+        marca = time.time()
+        for (_, fin), (segmentos, carga) in zip(cortes, self._pool.map(_transcribir_trozo, trabajos)):
+            tiempos["carga_modelo"] += carga
+            tiempos["inferencia"] = time.time() - marca
+            yield segmentos, fin / sample_rate, duracion
+
+    def transcribir(self, ruta, idioma="es", segundos_trozo=60, tiempos=None, palabras=False):
+        """Equivalente en paralelo de `transcribir`, con el mismo formato de resultado."""
+        inicio = time.time()
+        segmentos = []
+        duracion = 0.0
+        for nuevos, _, duracion in self.transcribir_por_trozos(ruta, idioma, segundos_trozo, tiempos, palabras):
+            segmentos.extend(nuevos)
+        return {
+            "text": "".join(s["text"] for s in segmentos),
+            "language": idioma,
+            "segments": segmentos,
+            "duration": duracion,
+            "tiempo_inferencia": time.time() - inicio,
+            "modelo": self.modelo,
+            "motor": self.motor,
+        }
+
+    def cerrar(self, esperar=True):
+        """Apaga los procesos; los trozos ya enviados terminan antes de que salgan."""
+        self._pool.shutdown(wait=esperar)
+
+
+class PoolParalelo:
+    """Mantiene un único `TranscriptorParalelo` vivo en todo el servidor.
+
+    Cada proceso del pool carga su propia copia del modelo, así que pedir otra
+    combinación de (modelo, procesos, motor) apaga el pool anterior en lugar de
+    acumular pools. El número de procesos se limita para que sus copias quepan
+    en `presupuesto_mb`, el mismo presupuesto que el registro de modelos.
+    """
+
+    def __init__(self, presupuesto_mb):
+        self.presupuesto_mb = presupuesto_mb
+        self._actual = None
+        self._bloqueo = threading.Lock()
+
+    def procesos_permitidos(self, modelo, procesos, motor=None):
+        por_proceso = estimar_mb(obtener_motor(motor), modelo)
+        if not por_proceso:
+            return procesos
+        return max(1, min(procesos, int(self.presupuesto_mb // por_proceso)))
+
+    def obtener(self, modelo="base", procesos=2, motor=None):
+        motor = obtener_motor(motor).nombre
+        procesos = self.procesos_permitidos(modelo, procesos, motor)
+        with self._bloqueo:
+            actual = self._actual
+            if actual is None or (actual.modelo, actual.procesos, actual.motor) != (modelo, procesos, motor):
+                if actual is not None:
+                    # Un trabajo que aún use el pool anterior recibe sus trozos ya enviados
+                    actual.cerrar(esperar=False)
+                self._actual = TranscriptorParalelo(modelo, procesos, motor)
+            return self._actual
+
+    def estadisticas(self):
+        with self._bloqueo:
+            actual = self._actual
+        if actual is None:
+            return None
+        return {
+            "modelo": actual.modelo,
+            "motor": actual.motor,
+            "procesos": actual.procesos,
+            "memoria_mb": actual.procesos * estimar_mb(obtener_motor(actual.motor), actual.modelo),
+            "presupuesto_mb": self.presupuesto_mb,
+        }
+
+
+def registrar_metricas(resultado, tiempos, tiempo_total, **extra):
+    """Añade al registro de métricas los tiempos y el rendimiento de una transcripción.
+
+    El factor de tiempo real son segundos de audio por segundo de pared (más
+    alto es más rápido). La memoria es el pico del proceso servidor desde que
+    arrancó, no el del trabajo. Devuelve el registro escrito.
+    """
+    duracion = resultado.get("duration") or 0.0
+    segmentos = len(resultado.get("segments", []))
+    medicion = {
+        "modelo": resultado.get("modelo"),
+        "motor": resultado.get("motor", "whisper"),
+        "idioma": resultado.get("language"),
+        **extra,
+        "duracion_audio": duracion,
+        "tiempo_carga_modelo": tiempos.get("carga_modelo", 0.0),
+        "tiempo_decodificacion_audio": tiempos.get("decodificacion_audio", 0.0),
+        "tiempo_inferencia": tiempos.get("inferencia", 0.0),
+        "tiempo_total": tiempo_total,
+        "factor_tiempo_real": duracion / tiempo_total if tiempo_total else None,
+        "segmentos": segmentos,
+        "segmentos_por_segundo": segmentos / tiempo_total if tiempo_total else None,
+        "memoria_pico_proceso": metricas.memoria_pico(),
+    }
+    metricas.registrar("transcripcion", medicion)
+    return medicion
+
+
+class CacheTranscripciones:
+    """Caché en disco de transcripciones direccionada por contenido.
+
+    Cada entrada es un JSON comprimido con gzip cuyos segmentos se guardan como
+    listas [inicio, fin, texto], con un cuarto elemento [[inicio, fin, palabra], ...]
+    cuando la transcripción trae marcas de tiempo por palabra. Se expulsan las entradas usadas hace más tiempo
+    cuando el directorio supera el tamaño máximo.
+    """
+
+    def __init__(self, directorio=None, max_mb=None):
+        self.directorio = directorio or CACHE_DIR_DEFECTO
+        self.max_bytes = (max_mb or CACHE_MB_DEFECTO) * 1024 * 1024
+        self.aciertos = 0
+        self.fallos = 0
+        self._bloqueo = threading.Lock()
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _ruta(self, hash_, modelo, idioma, motor):
+        # Las entradas de openai-whisper conservan el nombre que tenían antes de haber motores
+        if motor != "whisper":
+            modelo = f"{motor}-{modelo}"
+        return os.path.join(self.directorio, f"{hash_}_{modelo}_{idioma}.json.gz")
+
+    def obtener(self, hash_, modelo, idioma, motor="whisper"):
+        ruta = self._ruta(hash_, modelo, idioma, motor)
+        try:
+            with gzip.open(ruta, "rt", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            with self._bloqueo:
+                self.fallos += 1
+            return None
+        # Actualizar la fecha de modificación para que la expulsión sea LRU
+        os.utime(ruta)
+        with self._bloqueo:
+            self.aciertos += 1
+        segmentos = []
+        for inicio, fin, texto, *palabras in datos["segments"]:
+            segmento = {"start": inicio, "end": fin, "text": texto}
+            if palabras:
+                segmento["words"] = [{"start": a, "end": b, "word": p} for a, b, p in palabras[0]]
+            segmentos.append(segmento)
+        datos["segments"] = segmentos
+        return datos
+
+    @staticmethod
+    def _fila(segmento):
+        fila = [round(segmento["start"], 3), round(segmento["end"], 3), segmento["text"]]
+        if segmento.get("words"):
+            fila.append([[round(p["start"], 3), round(p["end"], 3), p["word"]] for p in segmento["words"]])
+        return fila
+
+    def guardar(self, hash_, modelo, idioma, resultado, motor="whisper"):
+        datos = dict(resultado)
+        datos["segments"] = [self._fila(s) for s in resultado["segments"]]
+        ruta = self._ruta(hash_, modelo, idioma, motor)
+        with escritura_atomica(ruta) as temporal, gzip.open(temporal, "wt", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, separators=(",", ":"))
+        self._expulsar()
+
+    def _entradas(self):
+        return entradas_por_uso(self.directorio, ".json.gz")
+
+    def _expulsar(self):
+        expulsar_lru(self.directorio, self.max_bytes, ".json.gz")
+
+    def estadisticas(self):
+        entradas = self._entradas()
+        total = self.aciertos + self.fallos
+        return {
+            "entradas": len(entradas),
+            "bytes": sum(tamano for _, tamano, _ in entradas),
+            "max_bytes": self.max_bytes,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / total if total else 0.0,
+            "directorio": self.directorio,
+        }
+
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from motores_transcripcion import obtener_motor
+
+
+# Presupuesto de memoria por defecto para los modelos cargados (en MB)
+PRESUPUESTO_MB_DEFECTO = int(os.environ.get("WHISPER_PRESUPUESTO_MB", "2048"))
+
+
+def detectar_dispositivo():
+    """Devuelve 'cuda' si hay GPU disponible y 'cpu' en caso contrario."""
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+def tamano_modelo_mb(modelo):
+    """Calcula los MB que ocupan en memoria los pesos de un modelo."""
+    total = 0
+    for param in modelo.parameters():
+        total += param.numel() * param.element_size()
+    return total / (1024 * 1024)
+
+
+class _Entrada:
+    def __init__(self, modelo, mb, tiempo_carga):
+        self.modelo = modelo
+        self.mb = mb
+        self.tiempo_carga = tiempo_carga
+        self.en_uso = 0
+        # Whisper instala hooks en el modelo al decodificar: una inferencia a la vez
+        self.bloqueo = threading.Lock()
+
+
+class RegistroModelos:
+    """Registro de modelos Whisper cargados una sola vez por proceso.
+
+    Los modelos se indexan por (nombre, dispositivo, motor) y se expulsan por
+    LRU cuando la memoria total supera el presupuesto configurado.
+    """
+
+    def __init__(self, presupuesto_mb=None):
+        self.presupuesto_mb = presupuesto_mb or PRESUPUESTO_MB_DEFECTO
+        self._entradas = OrderedDict()
+        self._bloqueo = threading.Lock()
+        self._bloqueos_carga = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.tiempo_carga_total = 0.0
+
+    def _clave(self, nombre, dispositivo, motor):
+        return (nombre, dispositivo or detectar_dispositivo(), obtener_motor(motor).nombre)
+
+    def _cargar(self, clave):
+        nombre, dispositivo, motor = clave
+        motor = obtener_motor(motor)
+        inicio = time.time()
+        modelo = motor.cargar(nombre, dispositivo)
+        return _Entrada(modelo, motor.tamano_mb(modelo), time.time() - inicio)
+
+    def _obtener_entrada(self, clave, reservar=False, contar=True):
+        """Devuelve la entrada de `clave`; con `reservar` la marca en uso sin soltar el cerrojo.
+
+        Marcarla dentro de la misma sección crítica impide que la carga de otro
+        hilo la expulse entre que se obtiene y se empieza a usar. Con
+        `contar=False` un acierto no suma a las estadísticas (las cargas sí).
+        """
+        with self._bloqueo:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += contar
+                entrada.en_uso += reservar
+                return entrada
+            bloqueo_carga = self._bloqueos_carga.setdefault(clave, threading.Lock())
+
+        # Solo una sesión carga cada modelo; las demás esperan y lo reutilizan
+        with bloqueo_carga:
+            with self._bloqueo:
+                entrada = self._entradas.get(clave)
+                if entrada is not None:
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += contar
+                    entrada.en_uso += reservar
+                    return entrada
+            entrada = self._cargar(clave)
+            with self._bloqueo:
+                self.fallos += 1
+                self.tiempo_carga_total += entrada.tiempo_carga
+                entrada.en_uso += reservar
+                self._entradas[clave] = entrada
+                self._expulsar(excepto=clave)
+            return entrada
+
+    def _expulsar(self, excepto):
+        """Libera los modelos menos usados hasta respetar el presupuesto."""
+        for clave in list(self._entradas):
+            if self.memoria_mb() <= self.presupuesto_mb:
+                break
+            entrada = self._entradas[clave]
+            if clave == excepto or entrada.en_uso:
+                continue
+            del self._entradas[clave]
+            self.expulsiones += 1
+            if clave[1] == "cuda":
+                import torch
+                torch.cuda.empty_cache()
+
+    def obtener(self, nombre="base", dispositivo=None, motor=None):
+        """Devuelve el modelo pedido, cargándolo solo si no está en memoria."""
+        return self._obtener_entrada(self._clave(nombre, dispositivo, motor)).modelo
+
+    @contextmanager
+    def uso(self, nombre="base", dispositivo=None, motor=None):
+        """Presta el modelo en exclusiva para una inferencia y evita su expulsión.
+
+        Quien transcribe llama antes a `obtener`, que es donde se cuenta el
+        acierto o el fallo: así cuentan peticiones y no lotes o trozos.
+        """
+        clave = self._clave(nombre, dispositivo, motor)
+        entrada = self._obtener_entrada(clave, reservar=True, contar=False)
+        try:
+            with entrada.bloqueo:
+                yield entrada.modelo
+        finally:
+            with self._bloqueo:
+                entrada.en_uso -= 1
+
+    def memoria_mb(self):
+        return sum(entrada.mb for entrada in self._entradas.values())
+
+    def estadisticas(self):
+        """Contadores de aciertos, fallos y tiempos de carga del registro."""
+        with self._bloqueo:
+            total = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / total if total else 0.0,
+                "expulsiones": self.expulsiones,
+                "tiempo_carga_total": self.tiempo_carga_total,
+                "memoria_mb": self.memoria_mb(),
+                "presupuesto_mb": self.presupuesto_mb,
+                "modelos": [
+                    {
+                        "nombre": nombre,
+                        "dispositivo": dispositivo,
+                        "motor": motor,
+                        "mb": e.mb,
+                        "tiempo_carga": e.tiempo_carga,
+                    }
+                    for (nombre, dispositivo, motor), e in self._entradas.items()
+                ],
+            }